@@ -0,0 +1,80 @@
+#! /usr/bin/env python3
+"""Time the report aggregation engine over synthetic years of history
+
+Builds the columns of a HistoryIndex in memory, then aggregates all of it with
+the pure python engine and, when numpy is installed, the vectorized one.
+"""
+
+import argparse
+from datetime import date, datetime, timedelta
+from importlib.util import find_spec
+import os
+import random
+import sys
+from time import perf_counter
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), os.pardir ) )
+import worklog
+
+
+def synthetic_history( years, entries, seed = 0 ):
+    """( days, strings ) of years of working days holding about entries tasks each"""
+    generator = random.Random( seed )
+    table = worklog.StringTable()
+    descriptions = [ 'lunch', 'break' ] + [ 'task {:d}'.format( idx ) for idx in range( 200 ) ]
+    days = list()
+    day = date( 2015, 1, 1 )
+    for _ in range( years * 365 ):
+        day += timedelta( days = 1 )
+        if day.weekday() >= 5: continue
+
+        columns = worklog.DayColumns( None )
+        start = worklog.to_epoch( datetime.combine( day, datetime.min.time() ) ) + 8 * 3600
+        for _ in range( max( 1, entries + generator.randint( -2, 2 ) ) ):
+            columns.starts.append( start )
+            columns.tickets.append( table.intern( 'PROJ-{:d}'.format( generator.randint( 1, 50 ) ) ) )
+            columns.descriptions.append( table.intern( generator.choice( descriptions ) ) )
+            start += generator.randint( 5, 90 ) * 60
+        columns.starts.append( start )
+        columns.tickets.append( worklog.StringTable.NONE )
+        columns.descriptions.append( worklog.DayColumns.GOHOME )
+        days.append( ( day.strftime( '%F' ), columns ) )
+    return days, table.strings
+
+
+def main():
+    parser = argparse.ArgumentParser( description = 'time the worklog aggregation engine' )
+    parser.add_argument( '--years', type = int, default = 5, help = 'years of synthetic history' )
+    parser.add_argument( '--entries', type = int, default = 12, help = 'average tasks per day' )
+    parser.add_argument( '--repeat', type = int, default = 5, help = 'runs per engine, the best is reported' )
+    args = parser.parse_args()
+
+    days, strings = synthetic_history( args.years, args.entries )
+    count = sum( len( columns.starts ) for day, columns in days )
+    sys.stdout.write( '{:d} days, {:d} entries\n'.format( len( days ), count ) )
+
+    if find_spec( 'numpy' ) is None:
+        engines = [ ( 'python', False ) ]
+        sys.stdout.write( 'numpy is not installed, only timing the pure python engine\n' )
+    else:
+        engines = [ ( 'python', False ), ( 'numpy', True ) ]
+
+    results = list()
+    for name, vectorize in engines:
+        best = None
+        for _ in range( args.repeat ):
+            began = perf_counter()
+            result = worklog.aggregate( days, strings, current = 0, vectorize = vectorize )
+            elapsed = perf_counter() - began
+            best = elapsed if best is None else min( best, elapsed )
+        results.append( result )
+        sys.stdout.write( '{:8s} {:10.1f}ms  {:8.0f} entries/ms\n'.format( name, best * 1000, count / ( best * 1000 ) ) )
+
+    for result in results[1:]:
+        if ( result.total, result.descriptions, result.tickets, result.days ) != ( results[0].total, results[0].descriptions, results[0].tickets, results[0].days ):
+            sys.stderr.write( 'engines disagree\n' )
+            sys.exit( 1 )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#! /usr/bin/env python3
+"""Time reading a year of history from day files and from monthly archives
+
+Writes a synthetic year of day files, loads every day of it, packs the months
+with archive and loads every day again, reporting the best time and the files
+opened for each, and checking both give the same entries. --cold drops the
+page cache before every scan, so each file really is read from the disk; it
+only works on Linux, as root.
+"""
+
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from time import perf_counter
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), os.pardir ) )
+import worklog
+from suite import HISTORIES, synthetic_tree
+
+
+def scan():
+    """The entries of every stored day, by day"""
+    return { day: [ worklog.entry_key( entry ) for entry in worklog.Worklog( when = day ) ] for day in worklog.scan_days() }
+
+
+def drop_caches():
+    os.sync()
+    with open( '/proc/sys/vm/drop_caches', 'w' ) as caches:
+        caches.write( '3\n' )
+
+
+def measure( repeat, cold ):
+    """( best seconds, files read, files stored, entries by day ) of scanning the history, with a fresh storage each time"""
+    best = None
+    for _ in range( repeat ):
+        worklog._storages.clear()
+        if cold:
+            drop_caches()
+        worklog.trace = worklog.Trace()
+        began = perf_counter()
+        days = scan()
+        elapsed = perf_counter() - began
+        best = elapsed if best is None else min( best, elapsed )
+    reads = worklog.trace.counts.get( 'file reads', 0 )
+    worklog.trace = None
+    return best, reads, len( os.listdir( worklog.WORKLOG_ROOT ) ), days
+
+
+def main():
+    parser = argparse.ArgumentParser( description = 'time reading a history from day files and from archives' )
+    parser.add_argument( '--history', choices = sorted( HISTORIES ), default = 'year', help = 'history to scan' )
+    parser.add_argument( '--entries', type = int, default = 12, help = 'average tasks per day' )
+    parser.add_argument( '--format', choices = sorted( worklog.SNAPSHOT_FORMATS ), default = 'json', help = 'snapshot format of the synthetic days' )
+    parser.add_argument( '--repeat', type = int, default = 5, help = 'scans of each layout, the best is reported' )
+    parser.add_argument( '--cold', action = 'store_true', help = 'drop the page cache before every scan, needs root' )
+    args = parser.parse_args()
+
+    # a cold scan has to read from a disk, and /tmp may well be in memory
+    directory = os.path.dirname( os.path.abspath( __file__ ) ) if args.cold else None
+    root = tempfile.mkdtemp( prefix = 'worklog-bench-', dir = directory )
+    worklog.WORKLOG_ROOT = root
+    try:
+        count = len( synthetic_tree( HISTORIES[args.history], args.entries, worklog.SNAPSHOT_FORMATS[args.format] ) )
+        sys.stdout.write( '{}: {:d} days\n'.format( args.history, count ) )
+
+        results = [ ( 'day files', ) + measure( args.repeat, args.cold ) ]
+        with redirect_stdout( io.StringIO() ):
+            worklog.on_archive( argparse.Namespace( month = None ) )
+        results.append( ( 'archives', ) + measure( args.repeat, args.cold ) )
+
+        for name, seconds, reads, files, days in results:
+            sys.stdout.write( '    {:10s} {:10.2f}ms {:8d} files read {:8d} files stored\n'.format( name, seconds * 1000, reads, files ) )
+        if results[0][4] != results[1][4]:
+            sys.stderr.write( 'the archives hold different entries than the day files\n' )
+            sys.exit( 1 )
+    finally:
+        shutil.rmtree( root )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#! /usr/bin/env python3
+"""Compare the json and compact snapshot formats on synthetic worklogs
+
+For each day size, reports the bytes on disk and the time to serialize and to
+parse one day with every codec.
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import os
+import random
+import sys
+from time import perf_counter
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), os.pardir ) )
+import worklog
+
+
+def synthetic_day( entries, seed = 0 ):
+    """A day of entries tasks on a handful of tickets, ending with a GoHome"""
+    generator = random.Random( seed )
+    start = datetime( 2015, 3, 17, 8, 0 )
+    store = list()
+    for idx in range( entries ):
+        ticket = 'PROJ-{:d}'.format( generator.randint( 1, 20 ) )
+        description = 'task number {:d} for {}'.format( generator.randint( 1, 10 ), ticket )
+        store.append( worklog.Task( start = start, ticket = ticket, description = description ) )
+        start += timedelta( minutes = generator.randint( 5, 90 ) )
+    store.append( worklog.GoHome( start = start ) )
+    return store
+
+
+def timed( function, argument, repeat ):
+    """Best of repeat runs, in seconds"""
+    best = None
+    for _ in range( repeat ):
+        began = perf_counter()
+        function( argument )
+        elapsed = perf_counter() - began
+        best = elapsed if best is None else min( best, elapsed )
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser( description = 'compare worklog snapshot formats' )
+    parser.add_argument( '--repeat', type = int, default = 20, help = 'runs per measurement, the best is reported' )
+    parser.add_argument( 'sizes', nargs = '*', type = int, default = [ 10, 100, 1000 ], help = 'entries per day' )
+    args = parser.parse_args()
+
+    sys.stdout.write( '{:>7s}  {:8s} {:>9s} {:>12s} {:>12s}\n'.format( 'entries', 'format', 'bytes', 'serialize', 'parse' ) )
+    for size in args.sizes:
+        store = synthetic_day( size )
+        for name in sorted( worklog.SNAPSHOT_FORMATS ):
+            codec = worklog.SNAPSHOT_FORMATS[name]
+            data = codec.dumps( store )
+            sys.stdout.write( '{:7d}  {:8s} {:9d} {:10.3f}ms {:10.3f}ms\n'.format(
+                size,
+                name,
+                len( data ),
+                timed( codec.dumps, store, args.repeat ) * 1000,
+                timed( codec.loads, data, args.repeat ) * 1000
+            ) )
+
+
+if __name__ == '__main__':
+    main()
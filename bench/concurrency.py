@@ -0,0 +1,80 @@
+#! /usr/bin/env python3
+"""Hammer a single day from many processes at once and check that no entry is lost
+
+Every process loads the day, adds one task and saves it, over and over; some
+saves also replace an entry to force the day to be rewritten. At the end the
+day has to hold exactly the tasks all processes added, at no less than
+--min-rate saves a second.
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), os.pardir ) )
+import worklog
+
+
+DAY = datetime( 2015, 3, 17 )
+
+
+def hammer( process, saves, rewrite_every ):
+    for idx in range( saves ):
+        day = worklog.Worklog( when = DAY.date() )
+        start = DAY + timedelta( seconds = process * saves + idx )
+        day.insert( worklog.Task( start = start, ticket = 'PROJ-{:d}'.format( process ), description = 'process {:d} save {:d}'.format( process, idx ) ) )
+        if rewrite_every and idx % rewrite_every == rewrite_every - 1:
+            # replacing an entry with an equal one forces a full rewrite of the day
+            position = day.position( start ) - 1
+            day[position] = worklog.Task( start = start, ticket = day[position].ticket, description = day[position].description )
+        day.save()
+
+
+def main():
+    parser = argparse.ArgumentParser( description = __doc__.splitlines()[0] )
+    parser.add_argument( '--processes', type = int, default = 8, help = 'processes saving at once, defaults to 8' )
+    parser.add_argument( '--saves', type = int, default = 100, help = 'saves made by each process, defaults to 100' )
+    parser.add_argument( '--rewrite-every', type = int, default = 10, help = 'rewrite the whole day every N saves, 0 never, defaults to 10' )
+    parser.add_argument( '--min-rate', type = float, default = 20, help = 'fail below this many saves a second, defaults to 20' )
+    parser.add_argument( '--storage', choices = sorted( worklog.STORAGE_BACKENDS ), default = 'files', help = 'storage backend to save to, defaults to files' )
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp( prefix = 'worklog-bench-' )
+    worklog.WORKLOG_ROOT = root
+    try:
+        with open( worklog.storage_path( 'config.json' ), 'w' ) as json_file:
+            json.dump( { 'storage': args.storage }, json_file )
+        context = multiprocessing.get_context( 'fork' )
+        processes = [ context.Process( target = hammer, args = ( process, args.saves, args.rewrite_every ) ) for process in range( args.processes ) ]
+        began = perf_counter()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = perf_counter() - began
+
+        failed = [ process for process in processes if process.exitcode != 0 ]
+        expected = args.processes * args.saves
+        found = len( worklog.Worklog( when = DAY.date() ) )
+        rate = expected / elapsed
+        sys.stdout.write( '{}, {:d} processes x {:d} saves: {:d} of {:d} entries kept, {:.0f} saves/s\n'.format(
+            args.storage, args.processes, args.saves, found, expected, rate ) )
+        if failed or found != expected:
+            sys.stdout.write( 'FAILED: {:d} processes failed, {:d} entries lost\n'.format( len( failed ), expected - found ) )
+            return 1
+        if rate < args.min_rate:
+            sys.stdout.write( 'FAILED: {:.0f} saves/s, below the minimum of {:.0f}\n'.format( rate, args.min_rate ) )
+            return 1
+        return 0
+    finally:
+        shutil.rmtree( root )
+
+
+if __name__ == '__main__':
+    sys.exit( main() )
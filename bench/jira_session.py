@@ -0,0 +1,189 @@
+#! /usr/bin/env python3
+"""Count the Jira calls an upload makes against a local stub server
+
+Uploads the same synthetic day several ways and reports, for each, how many
+requests reached the server, how many of them logged in with the password,
+and how many asked for the server's version:
+
+    previous   a new client logging in with the password, asking the server
+               for its version first, as every upload used to
+    login      the first upload, logging in with the password
+    resumed    the next upload, resuming the session the first one saved
+    expired    resuming a session the server has forgotten, which fails, logs
+               in again and retries
+
+Needs the jira package installed.
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import http.server
+from importlib.util import find_spec
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+from contextlib import redirect_stdout
+from time import perf_counter, sleep
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), os.pardir ) )
+import worklog
+
+
+class StubJiraHandler( http.server.BaseHTTPRequestHandler ):
+    """Just enough of the Jira REST api for upload, counting every request"""
+
+    lock = threading.Lock()
+    latency = 0.0
+    sessions = set()
+    counts = dict()
+    worklogs = 0
+
+    def count( self, name ):
+        with self.lock:
+            self.counts[name] = self.counts.get( name, 0 ) + 1
+
+    def respond( self, status, body, headers = () ):
+        data = json.dumps( body ).encode( 'utf-8' )
+        self.send_response( status )
+        self.send_header( 'Content-Type', 'application/json' )
+        self.send_header( 'Content-Length', str( len( data ) ) )
+        for name, value in headers:
+            self.send_header( name, value )
+        self.end_headers()
+        self.wfile.write( data )
+
+    def authorized( self ):
+        """Headers to send back if the request is authorized, None if it isn't"""
+        cookie = re.search( r'JSESSIONID=(\w+)', self.headers.get( 'Cookie', '' ) )
+        if cookie and cookie.group( 1 ) in self.sessions:
+            return []
+        if self.headers.get( 'Authorization', '' ).startswith( 'Basic ' ):
+            self.count( 'logins' )
+            with self.lock:
+                session = 'session{:d}'.format( len( self.sessions ) + 1 )
+                self.sessions.add( session )
+            return [ ( 'Set-Cookie', 'JSESSIONID={}; Path=/'.format( session ) ) ]
+        return None
+
+    def handle_request( self ):
+        self.count( 'requests' )
+        sleep( self.latency )
+        length = int( self.headers.get( 'Content-Length', 0 ) )
+        if length:
+            self.rfile.read( length )
+
+        headers = self.authorized()
+        if headers is None:
+            self.count( 'unauthorized' )
+            self.respond( 401, { 'errorMessages': [ 'You are not authenticated' ] } )
+            return
+
+        base = 'http://{}:{}/rest/api/2/'.format( *self.server.server_address )
+        path = self.path.split( '?' )[0]
+        if path.endswith( '/serverInfo' ):
+            self.count( 'server info' )
+            self.respond( 200, { 'baseUrl': base, 'version': '8.0.0', 'versionNumbers': [ 8, 0, 0 ], 'deploymentType': 'Server' }, headers )
+            return
+
+        match = re.match( r'^/rest/api/2/issue/([\w-]+)(/worklog)?$', path )
+        if match is None:
+            self.respond( 404, { 'errorMessages': [ 'not found' ] }, headers )
+        elif match.group( 2 ):
+            with self.lock:
+                StubJiraHandler.worklogs += 1
+                idx = StubJiraHandler.worklogs
+            self.respond( 201, { 'id': str( idx ), 'self': '{}issue/{}/worklog/{:d}'.format( base, match.group( 1 ), idx ) }, headers )
+        else:
+            self.respond( 200, { 'id': '1', 'key': match.group( 1 ), 'self': '{}issue/{}'.format( base, match.group( 1 ) ), 'fields': {} }, headers )
+
+    do_GET = handle_request
+    do_POST = handle_request
+    do_PUT = handle_request
+    do_DELETE = handle_request
+
+    def log_message( self, *args ):
+        pass
+
+
+class PreviousConnector( worklog.JiraConnector ):
+    """Connects the way upload used to, logging in and asking for the server's version every time"""
+
+    def connect( self, resume = True ):
+        from jira.client import JIRA
+
+        self.server = self.config['server']
+        self.username = self.config['username']
+        return JIRA( options = { 'server': self.server }, basic_auth = ( self.username, self.config['password'] ) )
+
+    def save( self, jira ):
+        pass
+
+
+def synthetic_day( day, entries ):
+    log = worklog.Worklog( when = day )
+    start = datetime.combine( day, datetime.min.time() ) + timedelta( hours = 8 )
+    for idx in range( entries ):
+        log.insert( worklog.Task( start = start, ticket = 'PROJ-{:d}'.format( idx % 3 + 1 ), description = 'task {:d}'.format( idx ) ) )
+        start += timedelta( minutes = 30 )
+    log.insert( worklog.GoHome( start = start ) )
+    log.save()
+    return log
+
+
+def upload( log, connector ):
+    """( seconds, requests by kind ) of uploading log as if for the first time"""
+    try:
+        os.unlink( worklog.storage_path( 'uploads.json' ) )
+    except FileNotFoundError:
+        pass
+    StubJiraHandler.counts = dict()
+    began = perf_counter()
+    with redirect_stdout( io.StringIO() ):
+        failures = worklog.log_to_jira( [ log ], rate = 0, connector = connector )
+    if failures:
+        raise RuntimeError( 'upload failed: {}'.format( failures ) )
+    return perf_counter() - began, dict( StubJiraHandler.counts )
+
+
+def main():
+    parser = argparse.ArgumentParser( description = 'count the jira calls of an upload against a local stub server' )
+    parser.add_argument( '--entries', type = int, default = 12, help = 'tasks in the uploaded day' )
+    parser.add_argument( '--latency', type = float, default = 0.02, help = 'seconds the stub server takes to answer each request' )
+    args = parser.parse_args()
+
+    if find_spec( 'jira' ) is None:
+        sys.stdout.write( 'jira is not installed, nothing to measure\n' )
+        return
+
+    StubJiraHandler.latency = args.latency
+    server = http.server.ThreadingHTTPServer( ( '127.0.0.1', 0 ), StubJiraHandler )
+    threading.Thread( target = server.serve_forever, daemon = True ).start()
+
+    root = tempfile.mkdtemp( prefix = 'worklog-bench-' )
+    worklog.WORKLOG_ROOT = root
+    try:
+        config = { 'server': 'http://127.0.0.1:{:d}'.format( server.server_address[1] ), 'username': 'bench', 'password': 'secret' }
+        with open( worklog.storage_path( 'config.json' ), 'w' ) as json_file:
+            json.dump( config, json_file )
+        log = synthetic_day( datetime( 2015, 3, 17 ).date(), args.entries )
+
+        runs = [ ( 'previous', PreviousConnector() ), ( 'login', worklog.JiraConnector() ), ( 'resumed', worklog.JiraConnector() ) ]
+        results = [ ( name, ) + upload( log, connector ) for name, connector in runs ]
+        StubJiraHandler.sessions.clear()
+        results.append( ( 'expired', ) + upload( log, worklog.JiraConnector() ) )
+
+        for name, seconds, counts in results:
+            sys.stdout.write( '{:10s} {:3d} requests  {:3d} logins  {:3d} server info  {:3d} unauthorized  {:7.1f}ms\n'.format(
+                name, counts.get( 'requests', 0 ), counts.get( 'logins', 0 ), counts.get( 'server info', 0 ), counts.get( 'unauthorized', 0 ), seconds * 1000 ) )
+    finally:
+        server.shutdown()
+        shutil.rmtree( root )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#! /usr/bin/env python3
+"""Time report rendering against the row by row rendering it replaced
+
+Renders a day holding thousands of tasks, with and without color, through
+worklog.report() and through a copy of the previous implementation, which
+wrote every row separately and built every escape sequence through Color.
+Both have to produce the same output.
+"""
+
+import argparse
+from datetime import timedelta
+import io
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import redirect_stdout
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), os.pardir ) )
+import worklog
+from worklog import Color, Duration, GoHome, DummyRightNow
+from suite import measure, synthetic_tree
+
+
+def previous_report( log ):
+    """report() as it was before the Renderer, aggregation included"""
+    day = log.when.strftime( '%F' )
+    table = worklog.StringTable()
+    result = worklog.aggregate( [ ( day, worklog.DayColumns.from_worklog( log, table ) ) ], table.strings, durations = True )
+
+    sys.stdout.write( '{} {}\n'.format(
+        Color.bold( 'Worklog Report for' ),
+        Color.purple( day, bold = True )
+    ) )
+
+    for ( task, next_task ), seconds in zip( log.pairwise(), result.durations[day] ):
+        if isinstance( task, GoHome ): continue
+
+        if isinstance( next_task, DummyRightNow ):
+            colorize_end_time = Color.yellow
+        else:
+            colorize_end_time = Color.green
+
+        sys.stdout.write( '    {:5s} {} {:5s} {}{!s:>7}{}  {}  {}\n'.format(
+            Color.green( task.start.strftime( '%H:%M' ) ),
+            Color.black( '-', intense = True ),
+            colorize_end_time( next_task.start.strftime( '%H:%M' ) ),
+            Color.black( '(', intense = True ),
+            Duration( timedelta( seconds = seconds ) ).colorized(),
+            Color.black( ')', intense = True ),
+            task.ticket,
+            task.description
+        ) )
+
+    sys.stdout.write( '\n    {!s:>7}  {}\n'.format(
+        Duration( timedelta( seconds = result.total ) ).colorized( underline = True ),
+        Color.colorize( 'TOTAL', bold = True, underline = True )
+    ) )
+    for key in sorted( result.descriptions.keys() ):
+        sys.stdout.write( '    {!s:>7}  {}\n'.format(
+            Duration( timedelta( seconds = result.descriptions[key] ) ).colorized(),
+            Color.bold( key )
+        ) )
+
+
+def rendered( render, log ):
+    """What render writes for log"""
+    output = io.StringIO()
+    with redirect_stdout( output ):
+        render( log )
+    return output.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser( description = 'time report rendering' )
+    parser.add_argument( '--rows', type = int, default = 5000, help = 'tasks in the rendered day, on average' )
+    parser.add_argument( '--repeat', type = int, default = 5, help = 'runs per renderer, the best is reported' )
+    args = parser.parse_args()
+
+    worklog.WORKLOG_ROOT = tempfile.mkdtemp( prefix = 'worklog-bench-' )
+    try:
+        day, = synthetic_tree( 1, args.rows, worklog.SNAPSHOT_FORMATS['json'] )
+        log = worklog.Worklog( when = day )
+    finally:
+        shutil.rmtree( worklog.WORKLOG_ROOT )
+
+    failed = False
+    for enabled in ( True, False ):
+        Color.ENABLED = enabled
+        before = measure( None, lambda unused: rendered( previous_report, log ), args.repeat )[0]
+        after = measure( None, lambda unused: rendered( worklog.report, log ), args.repeat )[0]
+        sys.stdout.write( '{:6s} {:d} rows: previous {:8.1f}ms  renderer {:8.1f}ms  {:.1f}x\n'.format(
+            'color' if enabled else 'plain', len( log ) - 1, before * 1000, after * 1000, before / after ) )
+        if rendered( worklog.report, log ) != rendered( previous_report, log ):
+            sys.stderr.write( 'output differs with color {}\n'.format( 'on' if enabled else 'off' ) )
+            failed = True
+    sys.exit( 1 if failed else 0 )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#! /usr/bin/env python3
+"""Measure worklog start-up latency and fail when a command exceeds its budget
+
+Each command runs in a fresh interpreter against a throwaway ~/.worklog, so real
+logs are never touched. The first run of a command is reported as cold and the
+median of the remaining runs as warm; only the warm time is held to the budget.
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+SCRIPT = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), os.pardir, 'worklog' )
+
+COMMANDS = {
+    'start': [ 'start', '--at', '09:00', '--ticket', 'BENCH-1', 'benchmarking', 'start', 'up' ],
+    'report': [ 'report' ],
+}
+
+
+def run( home, arguments, *options ):
+    # a fresh HOME alone isn't enough: WORKLOG_HOME would still point at the real worklogs,
+    # and a running daemon would answer in place of the interpreter being measured
+    env = dict( os.environ, HOME = home, WORKLOG_NO_DAEMON = '1' )
+    env.pop( 'WORKLOG_HOME', None )
+    began = time.perf_counter()
+    completed = subprocess.run(
+        [ sys.executable ] + list( options ) + [ SCRIPT ] + arguments,
+        env = env,
+        stdout = subprocess.DEVNULL,
+        stderr = subprocess.PIPE,
+        check = True,
+        universal_newlines = True,
+    )
+    return time.perf_counter() - began, completed.stderr
+
+
+def slowest_imports( home, arguments, count ):
+    """( cumulative microseconds, module ) of the slowest top level imports reported by -X importtime"""
+    elapsed, stderr = run( home, arguments, '-X', 'importtime' )
+    imports = list()
+    for line in stderr.splitlines():
+        if not line.startswith( 'import time:' ): continue
+        self_us, cumulative_us, name = line[len( 'import time:' ):].split( '|' )
+        if not cumulative_us.strip().isdigit(): continue
+        if name.startswith( '  ' ): continue
+        imports.append( ( int( cumulative_us ), name.strip() ) )
+    return sorted( imports, reverse = True )[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser( description = 'measure worklog start-up latency' )
+    parser.add_argument( '--runs', type = int, default = 10, help = 'runs per command, the first is the cold run' )
+    parser.add_argument( '--budget', type = float, default = 0.25, help = 'warm latency budget in seconds' )
+    parser.add_argument( '--importtime', action = 'store_true', help = 'also list the slowest imports of each command' )
+    parser.add_argument( 'commands', nargs = '*', default = sorted( COMMANDS ), help = 'commands to measure' )
+    args = parser.parse_args()
+
+    home = tempfile.mkdtemp( prefix = 'worklog-bench-' )
+    failed = list()
+    try:
+        for command in args.commands:
+            arguments = COMMANDS[command]
+            timings = [ run( home, arguments )[0] for _ in range( max( args.runs, 2 ) ) ]
+            cold = timings[0]
+            warm = statistics.median( timings[1:] )
+            verdict = 'ok' if warm <= args.budget else 'OVER BUDGET'
+            sys.stdout.write( '{:8s} cold {:7.1f}ms  warm {:7.1f}ms  budget {:7.1f}ms  {}\n'.format(
+                command, cold * 1000, warm * 1000, args.budget * 1000, verdict
+            ) )
+            if warm > args.budget:
+                failed.append( command )
+
+            if args.importtime:
+                for cumulative_us, name in slowest_imports( home, arguments, 5 ):
+                    sys.stdout.write( '         {:7.1f}ms  {}\n'.format( cumulative_us / 1000, name ) )
+    finally:
+        shutil.rmtree( home )
+
+    if failed:
+        sys.stderr.write( 'over budget: {}\n'.format( ', '.join( failed ) ) )
+        sys.exit( 1 )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+#! /usr/bin/env python3
+"""Time the main code paths of worklog against a synthetic ~/.worklog
+
+Builds a throwaway worklog directory holding days to years of history with a
+varying number of tasks per day, then runs each case several times, reporting
+the best time and the peak memory allocated by one run. --save keeps the results
+as json and --compare shows how a later run differs from saved results.
+"""
+
+import argparse
+from datetime import date, datetime, timedelta
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from time import perf_counter
+import tracemalloc
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), os.pardir ) )
+import worklog
+
+
+HISTORIES = {
+    'week': 7,
+    'year': 365,
+    'years': 5 * 365,
+}
+
+DESCRIPTIONS = [ 'lunch', 'break', 'code review', 'standup' ] + [ 'task {:d}'.format( idx ) for idx in range( 100 ) ]
+
+
+def synthetic_tree( days, entries, codec, seed = 0 ):
+    """Write days of working days ending on 2015-12-31, about entries tasks each, returns their dates"""
+    generator = random.Random( seed )
+    written = list()
+    day = date( 2015, 12, 31 ) - timedelta( days = days )
+    for _ in range( days ):
+        day += timedelta( days = 1 )
+        if day.weekday() >= 5: continue
+
+        log = worklog.Worklog( when = day )
+        start = datetime.combine( day, datetime.min.time() ) + timedelta( hours = 8 )
+        for _ in range( max( 1, generator.randint( entries // 2, entries * 3 // 2 ) ) ):
+            ticket = 'PROJ-{:d}'.format( generator.randint( 1, 50 ) ) if generator.random() < 0.8 else None
+            log.insert( worklog.Task( start = start, ticket = ticket, description = generator.choice( DESCRIPTIONS ) ) )
+            start += timedelta( minutes = generator.randint( 5, 90 ) )
+        log.insert( worklog.GoHome( start = start ) )
+        log.compact( codec )
+        written.append( day )
+    return written
+
+
+class StubJira( object ):
+    """Answers the calls JiraUploader makes without any network"""
+
+    class Worklog( object ):
+        def __init__( self, id ):
+            self.id = id
+
+        def update( self, **fields ):
+            pass
+
+        def delete( self ):
+            pass
+
+    def __init__( self ):
+        self.posted = 0
+
+    def issue( self, key ):
+        return key
+
+    def add_worklog( self, issue, timeSpent, started ):
+        self.posted += 1
+        return self.Worklog( str( self.posted ) )
+
+    def worklog( self, issue, id ):
+        return self.Worklog( id )
+
+
+class StubConnector( object ):
+    """Hands log_to_jira a StubJira instead of logging in"""
+
+    resumed = False
+
+    def connect( self, resume = True ):
+        return StubJira()
+
+    def save( self, jira ):
+        pass
+
+
+def case_load( days ):
+    return None, lambda unused: [ worklog.Worklog( when = day ) for day in days ]
+
+
+def case_save( days ):
+    def prepare():
+        logs = [ worklog.Worklog( when = day ) for day in days ]
+        for log in logs:
+            log.rewrite = True
+        return logs
+    return prepare, lambda logs: [ log.save() for log in logs ]
+
+
+def case_append( days ):
+    def prepare():
+        logs = [ worklog.Worklog( when = day ) for day in days[-20:] ]
+        for log in logs:
+            log.insert( worklog.Task( start = log[-1].start + timedelta( minutes = 1 ), ticket = 'PROJ-1', description = 'appended' ) )
+        return logs
+    return prepare, lambda logs: [ log.save() for log in logs ]
+
+
+def case_insert( days ):
+    def prepare():
+        generator = random.Random( 1 )
+        start = datetime( 2016, 1, 1, 8 )
+        tasks = [ worklog.Task( start = start + timedelta( seconds = idx ), ticket = None, description = 'task' ) for idx in range( 5000 ) ]
+        generator.shuffle( tasks )
+        return worklog.Worklog( when = date( 2016, 1, 1 ) ), tasks
+
+    def run( prepared ):
+        log, tasks = prepared
+        for task in tasks:
+            log.insert( task )
+    return prepare, run
+
+
+def case_pairwise( days ):
+    def run( logs ):
+        for log in logs:
+            for pair in log.pairwise():
+                pass
+    return lambda: [ worklog.Worklog( when = day ) for day in days ], run
+
+
+def case_report( days ):
+    def prepare():
+        return max( ( worklog.Worklog( when = day ) for day in days ), key = len )
+
+    def run( log ):
+        with redirect_stdout( io.StringIO() ):
+            worklog.report( log )
+    return prepare, run
+
+
+def case_range_report( days ):
+    def run( unused ):
+        with redirect_stdout( io.StringIO() ):
+            worklog.range_report( days[0], days[-1] )
+    return None, run
+
+
+def case_durations( days ):
+    def prepare():
+        generator = random.Random( 2 )
+        units = [ '{:d}d', '{:d}h', '{:d}m', '0.{:d}h', '{:d}h {:d}m', '{:d}d{:d}h{:d}m' ]
+        return [ generator.choice( units ).format( *( generator.randint( 1, 9 ) for _ in range( 3 ) ) ) for _ in range( 10000 ) ]
+    return prepare, lambda durations: [ worklog.duration_to_timedelta( duration ) for duration in durations ]
+
+
+def case_upload( days ):
+    def prepare():
+        try:
+            os.unlink( worklog.storage_path( 'uploads.json' ) )
+        except FileNotFoundError:
+            pass
+        return [ worklog.Worklog( when = day ) for day in days[-20:] ]
+
+    def run( logs ):
+        # the uploader's summary is discarded with the rest of the output
+        with redirect_stdout( io.StringIO() ):
+            worklog.log_to_jira( logs, rate = 0, connector = StubConnector() )
+    return prepare, run
+
+
+CASES = {
+    'load': case_load,
+    'save': case_save,
+    'append': case_append,
+    'insert': case_insert,
+    'pairwise': case_pairwise,
+    'report': case_report,
+    'range-report': case_range_report,
+    'durations': case_durations,
+    'upload': case_upload,
+}
+
+
+def measure( prepare, run, repeat ):
+    """( best seconds, peak bytes ) of run, given what prepare returns before each run"""
+    best = None
+    for _ in range( repeat ):
+        prepared = prepare() if prepare is not None else None
+        began = perf_counter()
+        run( prepared )
+        elapsed = perf_counter() - began
+        best = elapsed if best is None else min( best, elapsed )
+
+    # a separate run, since tracing allocations slows everything down
+    prepared = prepare() if prepare is not None else None
+    tracemalloc.start()
+    try:
+        run( prepared )
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser( description = 'time worklog against synthetic histories' )
+    parser.add_argument( '--history', choices = sorted( HISTORIES ), action = 'append', help = 'history sizes to run, can be repeated, defaults to week and year' )
+    parser.add_argument( '--entries', type = int, default = 12, help = 'average tasks per day' )
+    parser.add_argument( '--format', choices = sorted( worklog.SNAPSHOT_FORMATS ), default = 'json', help = 'snapshot format of the synthetic days' )
+    parser.add_argument( '--storage', choices = sorted( worklog.STORAGE_BACKENDS ), default = 'files', help = 'storage backend of the synthetic days' )
+    parser.add_argument( '--repeat', type = int, default = 5, help = 'runs per case, the best is reported' )
+    parser.add_argument( '--save', metavar = 'PATH', help = 'write the results to PATH as json' )
+    parser.add_argument( '--compare', metavar = 'PATH', help = 'show the change from results saved with --save' )
+    parser.add_argument( 'cases', nargs = '*', default = list( CASES ), help = 'cases to run, defaults to all' )
+    args = parser.parse_args()
+
+    previous = dict()
+    if args.compare:
+        with open( args.compare ) as json_file:
+            previous = json.load( json_file )
+
+    results = dict()
+    for history in args.history or [ 'week', 'year' ]:
+        root = tempfile.mkdtemp( prefix = 'worklog-bench-' )
+        worklog.WORKLOG_ROOT = root
+        try:
+            with open( worklog.storage_path( 'config.json' ), 'w' ) as json_file:
+                json.dump( { 'storage': args.storage }, json_file )
+            days = synthetic_tree( HISTORIES[history], args.entries, worklog.SNAPSHOT_FORMATS[args.format] )
+            sys.stdout.write( '{}: {:d} days\n'.format( history, len( days ) ) )
+            for name in args.cases:
+                prepare, run = CASES[name]( days )
+                seconds, peak = measure( prepare, run, args.repeat )
+                key = '{} {}'.format( history, name )
+                results[key] = { 'seconds': seconds, 'peak': peak }
+
+                change = ''
+                if key in previous:
+                    change = '  {:+6.1f}% time  {:+6.1f}% memory'.format(
+                        ( seconds / previous[key]['seconds'] - 1 ) * 100,
+                        ( peak / previous[key]['peak'] - 1 ) * 100 if previous[key]['peak'] else 0 )
+                sys.stdout.write( '    {:14s} {:10.2f}ms {:10.0f}KiB peak{}\n'.format( name, seconds * 1000, peak / 1024, change ) )
+        finally:
+            shutil.rmtree( root )
+
+    if args.save:
+        with open( args.save, 'w' ) as json_file:
+            json.dump( results, json_file, indent = 2, sort_keys = True )
+            json_file.write( '\n' )
+
+
+if __name__ == '__main__':
+    main()
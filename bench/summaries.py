@@ -0,0 +1,95 @@
+#! /usr/bin/env python3
+"""Time range reports from raw entries and from the summary cache
+
+Writes a synthetic history, then adds up all of it and its last week three
+ways, each as a report run on its own would: loading the history index and
+aggregating every entry, as range reports used to, summarizing with an empty
+summary cache, which fills it, and summarizing with the cache already filled,
+which needs neither the index nor the day files. Checks all three agree.
+"""
+
+import argparse
+from datetime import timedelta
+import os
+import shutil
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), os.pardir ) )
+import worklog
+from suite import HISTORIES, synthetic_tree
+
+
+def aggregated( first, last ):
+    """Aggregate of the days first to last the way range reports used to add them up"""
+    index = worklog.HistoryIndex()
+    index.refresh()
+    return worklog.aggregate( index.between( first, last ), index.strings )
+
+
+def summarized( first, last ):
+    """Aggregate of the days first to last the way range reports add them up now"""
+    found = worklog.scan_days()
+    span = first.strftime( '%F' ), last.strftime( '%F' )
+    stamps = [ ( day, found[day] ) for day in sorted( found ) if span[0] <= day <= span[1] ]
+
+    def load( days ):
+        index = worklog.load_history_index()
+        return [ ( day, index.days[day] ) for day in days if day in index.days ], index.strings
+    return worklog.summarize( stamps, worklog.SummaryCache(), load )
+
+
+def best_of( repeat, prepare, run ):
+    best = None
+    for _ in range( repeat ):
+        prepared = prepare()
+        began = perf_counter()
+        result = run( prepared )
+        elapsed = perf_counter() - began
+        best = elapsed if best is None else min( best, elapsed )
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser( description = 'time range reports with and without the summary cache' )
+    parser.add_argument( '--history', choices = sorted( HISTORIES ), default = 'years', help = 'history to report on' )
+    parser.add_argument( '--entries', type = int, default = 12, help = 'average tasks per day' )
+    parser.add_argument( '--repeat', type = int, default = 5, help = 'runs of each way, the best is reported' )
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp( prefix = 'worklog-bench-' )
+    worklog.WORKLOG_ROOT = root
+    try:
+        days = synthetic_tree( HISTORIES[args.history], args.entries, worklog.JsonCodec )
+        worklog.HistoryIndex().refresh()
+        sys.stdout.write( '{}: {:d} days\n'.format( args.history, len( days ) ) )
+        monday = days[-1] - timedelta( days = days[-1].weekday() )
+        ranges = [ ( 'whole history', days[0], days[-1] ), ( 'last week', monday, monday + timedelta( days = 6 ) ) ]
+
+        def fresh():
+            # as in a process of its own
+            worklog._storages.clear()
+
+        def empty_cache():
+            fresh()
+            shutil.rmtree( worklog.storage_path( 'summaries' ), ignore_errors = True )
+
+        ways = [ ( 'aggregate', fresh, aggregated ), ( 'cold cache', empty_cache, summarized ), ( 'warm cache', fresh, summarized ) ]
+        expected = dict()
+        for name, prepare, run in ways:
+            times = list()
+            for span, first, last in ranges:
+                seconds, result = best_of( args.repeat, prepare, lambda unused: run( first, last ) )
+                totals = ( result.total, result.days, result.descriptions, result.tickets )
+                if expected.setdefault( span, totals ) != totals:
+                    sys.stderr.write( '{} disagrees with aggregate over the {}\n'.format( name, span ) )
+                    sys.exit( 1 )
+                times.append( '{:10.2f}ms {}'.format( seconds * 1000, span ) )
+            sys.stdout.write( '    {:12s} {}\n'.format( name, ' '.join( times ) ) )
+    finally:
+        shutil.rmtree( root )
+
+
+if __name__ == '__main__':
+    main()
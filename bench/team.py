@@ -0,0 +1,74 @@
+#! /usr/bin/env python3
+"""Time team-report over many users' synthetic worklog directories
+
+Writes one synthetic user's history, copies it for every other user, then
+totals all of them with one process and with more, doubling up to one per cpu,
+reporting the speedup over a single process and checking the totals agree. The
+first user's config excludes nothing from rollups, which must not change how
+anyone is counted.
+"""
+
+import argparse
+from datetime import date
+import os
+import shutil
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), os.pardir ) )
+import worklog
+from suite import HISTORIES, synthetic_tree
+
+
+def main():
+    parser = argparse.ArgumentParser( description = 'time team-report over many users' )
+    parser.add_argument( '--users', type = int, default = 32, help = 'users in the team' )
+    parser.add_argument( '--history', choices = sorted( HISTORIES ), default = 'year', help = 'history of each user' )
+    parser.add_argument( '--entries', type = int, default = 12, help = 'average tasks per day' )
+    parser.add_argument( '--repeat', type = int, default = 3, help = 'runs per worker count, the best is reported' )
+    args = parser.parse_args()
+
+    base = tempfile.mkdtemp( prefix = 'worklog-bench-' )
+    try:
+        worklog.WORKLOG_ROOT = first_root = os.path.join( base, 'user0' )
+        days = synthetic_tree( HISTORIES[args.history], args.entries, worklog.JsonCodec )
+        roots = [ first_root ]
+        for idx in range( 1, args.users ):
+            roots.append( os.path.join( base, 'user{:d}'.format( idx ) ) )
+            shutil.copytree( first_root, roots[-1] )
+        with open( os.path.join( first_root, 'config.json' ), 'w' ) as config:
+            config.write( '{"rollup_exclude": []}\n' )
+        worklog.WORKLOG_ROOT = base
+        sys.stdout.write( '{:d} users, {:d} days each\n'.format( args.users, len( days ) ) )
+
+        # two workers even on one cpu, so the in-process and the pooled paths are always compared
+        counts = [ 1, 2 ]
+        while counts[-1] * 2 <= ( os.cpu_count() or 1 ):
+            counts.append( counts[-1] * 2 )
+
+        baseline = None
+        expected = None
+        for workers in counts:
+            best = None
+            for _ in range( args.repeat ):
+                # as in a command of its own, the exclusions are read again from the config
+                worklog._rollup_exclusions = None
+                began = perf_counter()
+                totals = worklog.team_totals( roots, date( 2000, 1, 1 ), date( 2015, 12, 31 ), workers )
+                elapsed = perf_counter() - began
+                best = elapsed if best is None else min( best, elapsed )
+            if expected is None:
+                baseline, expected = best, totals
+            elif totals != expected:
+                sys.stderr.write( 'totals of {:d} workers differ from those of one\n'.format( workers ) )
+                sys.exit( 1 )
+            sys.stdout.write( '{:3d} workers {:10.1f}ms  {:5.2f}x\n'.format( workers, best * 1000, baseline / best ) )
+        if ( os.cpu_count() or 1 ) == 1:
+            sys.stdout.write( 'only one cpu, the speedups mean nothing\n' )
+    finally:
+        shutil.rmtree( base )
+
+
+if __name__ == '__main__':
+    main()
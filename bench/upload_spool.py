@@ -0,0 +1,242 @@
+#! /usr/bin/env python3
+"""Upload through the spool to a local stand-in for Jira that drops connections
+
+Spools a few synthetic days and sends them to a stub server, checking that in
+the end Jira holds every interval and the spool is empty:
+
+    offline    nothing listens on the server's port: how long upload takes
+               to give up, which it does after a batch of which nothing got
+               through, leaving every entry in the spool
+    stop       stop with upload_on_stop set, which only spools the day and
+               starts a worker in the background, against a slow server
+    flaky      the server drops a share of the connections unanswered; the
+               spool is flushed again until it's empty, as the worker would
+    killed     a flush is killed outright halfway through, then flushed again;
+               intervals posted twice are ones Jira took whose answer was lost
+
+Needs the jira package installed.
+"""
+
+import argparse
+from datetime import date, datetime, timedelta
+import http.server
+from importlib.util import find_spec
+import io
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+from contextlib import redirect_stdout, redirect_stderr
+from time import perf_counter, sleep
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), os.pardir ) )
+import worklog
+from jira_session import StubJiraHandler
+
+
+class FlakyJiraHandler( StubJiraHandler ):
+    """The stub server, hanging up without an answer on a share of the requests, and keeping every worklog posted"""
+
+    drop = 0.0
+    generator = random.Random( 0 )
+    posted = dict()
+
+    def handle_request( self ):
+        with self.lock:
+            dropped = self.generator.random() < self.drop
+        if dropped:
+            self.count( 'dropped' )
+            self.close_connection = True
+            return
+
+        if self.command == 'POST' and self.path.split( '?' )[0].endswith( '/worklog' ):
+            length = int( self.headers.get( 'Content-Length', 0 ) )
+            body = json.loads( self.rfile.read( length ).decode( 'utf-8' ) )
+            self.headers.replace_header( 'Content-Length', '0' )
+            key = ( self.path.split( '/' )[-2], body['started'] )
+            with self.lock:
+                self.posted[key] = self.posted.get( key, 0 ) + 1
+        StubJiraHandler.handle_request( self )
+
+    do_GET = handle_request
+    do_POST = handle_request
+    do_PUT = handle_request
+    do_DELETE = handle_request
+
+
+def synthetic_days( first, count, entries ):
+    days = list()
+    for offset in range( count ):
+        log = worklog.Worklog( when = first + timedelta( days = offset ) )
+        start = datetime.combine( log.when, datetime.min.time() ) + timedelta( hours = 8 )
+        for idx in range( entries ):
+            log.insert( worklog.Task( start = start, ticket = 'PROJ-{:d}'.format( idx % 5 + 1 ), description = 'task {:d}'.format( idx ) ) )
+            start += timedelta( minutes = 30 )
+        log.insert( worklog.GoHome( start = start ) )
+        log.save()
+        days.append( log )
+    return days
+
+
+def fresh_root( port ):
+    """A new worklog directory set up for the stub server on port"""
+    worklog.WORKLOG_ROOT = tempfile.mkdtemp( prefix = 'worklog-bench-' )
+    worklog._storages.clear()
+    config = { 'server': 'http://127.0.0.1:{:d}'.format( port ), 'username': 'bench', 'password': 'secret' }
+    with open( worklog.storage_path( 'config.json' ), 'w' ) as json_file:
+        json.dump( config, json_file )
+    FlakyJiraHandler.posted = dict()
+    FlakyJiraHandler.counts = dict()
+
+
+def quietly( function, *args, **kwargs ):
+    with redirect_stdout( io.StringIO() ), redirect_stderr( io.StringIO() ):
+        return function( *args, **kwargs )
+
+
+def check( logs ):
+    """( intervals, intervals posted more than once ), failing unless Jira has every interval and the spool is empty"""
+    expected = set()
+    for log in logs:
+        for task, duration, started in worklog.upload_entries( log ):
+            expected.add( ( task.ticket, started.strftime( '%Y-%m-%dT%H:%M:%S.000%z' ) ) )
+    missing = expected.difference( FlakyJiraHandler.posted )
+    left = worklog.UploadSpool().entries()
+    if missing or left:
+        sys.stderr.write( '{:d} intervals never reached jira, {:d} entries left in the spool\n'.format( len( missing ), len( left ) ) )
+        sys.exit( 1 )
+    return len( expected ), sum( count - 1 for count in FlakyJiraHandler.posted.values() )
+
+
+def flush_until_empty( limit = 10 ):
+    """Flushes it took to empty the spool"""
+    for flushes in range( 1, limit + 1 ):
+        quietly( worklog.flush_spool, rate = 0 )
+        if not worklog.UploadSpool().entries():
+            return flushes
+    return limit
+
+
+def run_offline( args, server ):
+    # a port nobody listens on
+    probe = socket.socket()
+    probe.bind( ( '127.0.0.1', 0 ) )
+    port = probe.getsockname()[1]
+    probe.close()
+
+    fresh_root( port )
+    logs = synthetic_days( date( 2015, 3, 16 ), args.days, args.entries )
+    began = perf_counter()
+    failures = quietly( worklog.log_to_jira, logs, rate = 0 )
+    elapsed = perf_counter() - began
+    left = len( worklog.UploadSpool().entries() )
+    intervals = sum( len( list( worklog.upload_entries( log ) ) ) for log in logs )
+    sys.stdout.write( '{:8s} {:8.1f}s to give up  {:4d} failed  {:4d} of {:d} entries spooled\n'.format( 'offline', elapsed, len( failures ), left, intervals ) )
+    if left != intervals:
+        sys.stderr.write( 'every entry should be left in the spool\n' )
+        sys.exit( 1 )
+
+
+def run_stop( args, server ):
+    fresh_root( server.server_address[1] )
+    with open( worklog.storage_path( 'config.json' ), 'r+' ) as json_file:
+        config = json.load( json_file )
+        config['upload_on_stop'] = True
+        json_file.seek( 0 )
+        json.dump( config, json_file )
+    when = date( 2015, 3, 16 )
+    log = worklog.Worklog( when = when )
+    start = datetime.combine( when, datetime.min.time() ) + timedelta( hours = 8 )
+    for idx in range( args.entries ):
+        log.insert( worklog.Task( start = start + timedelta( minutes = 30 * idx ), ticket = 'PROJ-1', description = 'task {:d}'.format( idx ) ) )
+    log.save()
+
+    stop = argparse.Namespace( day = when.strftime( '%F' ), at = '{:d}:00'.format( 8 + args.entries ), ago = None )
+    began = perf_counter()
+    quietly( worklog.on_stop, stop )
+    stopped = perf_counter() - began
+    while worklog.UploadSpool().entries() and perf_counter() - began < 60:
+        sleep( 0.05 )
+    # the worker lets go of its lock once it's done
+    with worklog.FileLock( worklog.storage_path( 'locks', 'upload-worker.lock' ) ):
+        uploaded = perf_counter() - began
+    intervals, twice = check( [ worklog.Worklog( when = when ) ] )
+    sys.stdout.write( '{:8s} {:8.1f}ms stop  {:8.1f}ms until uploaded in the background  {:4d} intervals\n'.format( 'stop', stopped * 1000, uploaded * 1000, intervals ) )
+
+
+def run_flaky( args, server ):
+    fresh_root( server.server_address[1] )
+    logs = synthetic_days( date( 2015, 3, 16 ), args.days, args.entries )
+    for log in logs:
+        worklog.UploadSpool().put( log, worklog.UploadLedger() )
+    FlakyJiraHandler.drop = args.drop
+    try:
+        began = perf_counter()
+        flushes = flush_until_empty()
+        elapsed = perf_counter() - began
+    finally:
+        FlakyJiraHandler.drop = 0.0
+    intervals, twice = check( logs )
+    sys.stdout.write( '{:8s} {:8.1f}s  {:4d} flushes  {:4d} intervals  {:4d} requests  {:4d} dropped  {:4d} posted twice\n'.format(
+        'flaky', elapsed, flushes, intervals, FlakyJiraHandler.counts.get( 'requests', 0 ), FlakyJiraHandler.counts.get( 'dropped', 0 ), twice ) )
+
+
+def run_killed( args, server ):
+    fresh_root( server.server_address[1] )
+    logs = synthetic_days( date( 2015, 3, 16 ), args.days, args.entries )
+    for log in logs:
+        worklog.UploadSpool().put( log, worklog.UploadLedger() )
+    total = len( worklog.UploadSpool().entries() )
+
+    command = [ sys.executable, os.path.abspath( worklog.__file__ ), '--root', worklog.WORKLOG_ROOT, 'upload', '--flush', '--rate', '0' ]
+    flush = subprocess.Popen( command, stdin = subprocess.DEVNULL, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL )
+    while sum( FlakyJiraHandler.posted.values() ) < total // 2 and flush.poll() is None:
+        sleep( 0.001 )
+    flush.send_signal( signal.SIGKILL )
+    flush.wait()
+    left = len( worklog.UploadSpool().entries() )
+    try:
+        with open( worklog.UploadSpool().journal ) as journal_file:
+            sent = len( journal_file.read().splitlines() )
+    except FileNotFoundError:
+        sent = 0
+
+    flushes = flush_until_empty()
+    intervals, twice = check( logs )
+    sys.stdout.write( '{:8s} {:4d} of {:d} entries left, {:d} acknowledged  {:4d} flushes after  {:4d} intervals  {:4d} posted twice\n'.format(
+        'killed', left, total, sent, flushes, intervals, twice ) )
+
+
+def main():
+    parser = argparse.ArgumentParser( description = 'upload through the spool to a stub jira that drops connections' )
+    parser.add_argument( '--days', type = int, default = 5, help = 'days uploaded' )
+    parser.add_argument( '--entries', type = int, default = 12, help = 'tasks in each day' )
+    parser.add_argument( '--drop', type = float, default = 0.3, help = 'share of the connections the flaky server drops' )
+    parser.add_argument( '--latency', type = float, default = 0.01, help = 'seconds the stub server takes to answer each request' )
+    args = parser.parse_args()
+
+    if find_spec( 'jira' ) is None:
+        sys.stdout.write( 'jira is not installed, nothing to measure\n' )
+        return
+
+    FlakyJiraHandler.latency = args.latency
+    server = http.server.ThreadingHTTPServer( ( '127.0.0.1', 0 ), FlakyJiraHandler )
+    threading.Thread( target = server.serve_forever, daemon = True ).start()
+    try:
+        for run in ( run_offline, run_stop, run_flaky, run_killed ):
+            try:
+                run( args, server )
+            finally:
+                shutil.rmtree( worklog.WORKLOG_ROOT, ignore_errors = True )
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,19 @@
 #! /usr/bin/env python3
 
-import argparse
-from collections import Callable
+# Keep module level imports to what every command needs, worklog runs dozens of times a day, often from shell
+# prompts. Heavy or rarely needed modules (jira, getpass, textwrap) are imported by the code that uses them, and
+# argparse only by build_parser(), since commands handed to the daemon never parse their arguments here.
+from array import array
 from collections.abc import MutableSequence
-from datetime import date, datetime, timedelta, time
+from datetime import date, datetime, timedelta, time, timezone
 import errno
-from getpass import getpass
-import itertools
-from jira.client import JIRA
 import json
 import os
 import re
+import struct
 import sys
-import textwrap
+from time import perf_counter, sleep, time_ns
+import zlib
 
 
 
@@ -27,6 +28,86 @@ def now():
     return now.replace( second = 0, microsecond = 0 )
 
 
+
+class Trace( object ):
+    """Where the time of one command went, enabled by --profile or WORKLOG_TRACE
+
+    Phases are timed by wall clock each time they're entered; a phase includes
+    the phases run within it, and phases run by several threads at once, like
+    jira calls, add up to more than the time that passed. Counters tally what
+    the command did, such as file reads and writes and network calls."""
+
+    def __init__( self, started = None ):
+        from threading import Lock
+
+        self.started = started if started is not None else perf_counter()
+        self.phases = dict()
+        self.counts = dict()
+        self.lock = Lock()
+
+    def add( self, name, seconds ):
+        with self.lock:
+            phase = self.phases.setdefault( name, [ 0, 0.0 ] )
+            phase[0] += 1
+            phase[1] += seconds
+
+    def count( self, name, amount = 1 ):
+        with self.lock:
+            self.counts[name] = self.counts.get( name, 0 ) + amount
+
+    def to_json( self ):
+        return {
+            'total': perf_counter() - self.started,
+            'phases': { name: { 'calls': calls, 'seconds': seconds } for name, ( calls, seconds ) in self.phases.items() },
+            'counts': self.counts,
+        }
+
+    def write( self, stream ):
+        data = self.to_json()
+        stream.write( 'worklog trace, {:.1f}ms in total\n'.format( data['total'] * 1000 ) )
+        for name, phase in sorted( data['phases'].items(), key = lambda item: item[1]['seconds'], reverse = True ):
+            stream.write( '    {:>9.1f}ms {:>6d}x  {}\n'.format( phase['seconds'] * 1000, phase['calls'], name ) )
+        for name in sorted( data['counts'] ):
+            stream.write( '    {:>12d}   {}\n'.format( data['counts'][name], name ) )
+
+
+class TracePhase( object ):
+    __slots__ = ( 'trace', 'name', 'began' )
+
+    def __init__( self, trace, name ):
+        self.trace = trace
+        self.name = name
+
+    def __enter__( self ):
+        self.began = perf_counter()
+        return self
+
+    def __exit__( self, *exc_info ):
+        self.trace.add( self.name, perf_counter() - self.began )
+
+
+class Untraced( object ):
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *exc_info ):
+        pass
+
+
+# the Trace of this command, None unless tracing was asked for
+trace = None
+untraced = Untraced()
+
+def traced( name ):
+    """Context timing the phase name of the Trace, doing nothing when not tracing"""
+    return untraced if trace is None else TracePhase( trace, name )
+
+
+def trace_count( name, amount = 1 ):
+    if trace is not None:
+        trace.count( name, amount )
+
+
 duration_factors = {
     'd': 60 * 60 * 8,
     'h': 60 * 60,
@@ -284,92 +365,495 @@ class Duration( object ):
 
 
 
+def color_enabled( stream ):
+    """Whether to color output to stream: WORKLOG_COLOR=always or never, otherwise only on a terminal"""
+    setting = os.environ.get( 'WORKLOG_COLOR', 'auto' )
+    if setting == 'always': return True
+    if setting == 'never': return False
+    return stream.isatty()
+
+
+class Renderer( object ):
+    """Collects the output of a report and writes it at once
+
+    The escape sequences around each kind of cell are taken from Color once,
+    when the renderer is made, and every distinct duration is colorized once,
+    so the output is exactly what Color would produce, without rebuilding it
+    for every row. With Color disabled, the sequences are empty."""
+
+    def __init__( self, stream = None ):
+        self.stream = stream if stream is not None else sys.stdout
+        self.parts = list()
+        self.colorized = dict()
+
+        self.title = self.wrap( Color.bold )
+        self.heading = self.wrap( Color.purple, bold = True )
+        self.time = self.wrap( Color.green )
+        self.open_time = self.wrap( Color.yellow )
+        self.ticket = self.wrap( Color.cyan )
+        self.label = self.wrap( Color.bold )
+        self.day = self.wrap( Color.purple )
+        dash, paren, close = ( Color.black( mark, intense = True ) for mark in '-()' )
+        self.dash = ' {} '.format( dash )
+        self.paren = ' {}'.format( paren )
+        self.close = '{}  '.format( close )
+        self.total = Color.colorize( 'TOTAL', bold = True, underline = True )
+
+    @staticmethod
+    def wrap( style, **kwargs ):
+        """( before, after ) escape sequences of style"""
+        if not Color.ENABLED:
+            return '', ''
+        return tuple( style( '\0', **kwargs ).split( '\0' ) )
+
+    def duration( self, seconds, underline = False ):
+        key = ( seconds, underline )
+        text = self.colorized.get( key )
+        if text is None:
+            if underline:
+                text = Duration( timedelta( seconds = seconds ) ).colorized( underline = True )
+            else:
+                text = Duration( timedelta( seconds = seconds ) ).colorized()
+            text = self.colorized[key] = '{!s:>7}'.format( text )
+        return text
+
+    def write( self, *parts ):
+        self.parts.extend( parts )
+
+    def cell( self, style, value ):
+        self.parts.extend( ( style[0], value, style[1] ) )
+
+    def flush( self ):
+        self.stream.write( ''.join( self.parts ) )
+        self.parts = list()
+
+
+
+def parse_date( value ):
+    """Parse a YYYY-MM-DD string into a date"""
+    return datetime.strptime( value, '%Y-%m-%d' ).date()
+
+
 def resolve_at_or_ago( args, date ):
     if args.at:
         hour, minute = args.at.split( ':' )
         start = time( hour = int( hour ), minute = int( minute ) )
         return datetime.combine( date, start )
     elif args.ago:
-        return now() - duration_to_timedelta( args.ago )
+        return ( now() - duration_to_timedelta( args.ago ) ).replace( second = 0, microsecond = 0 )
     else:
         return now()
 
 
 
+ROLLUP_EXCLUDE = ( 'lunch', 'break' )
+
+_rollup_exclusions = None
+
+def rollup_exclusions():
+    """Lowercased descriptions left out of rollups, "rollup_exclude" in the config file or ROLLUP_EXCLUDE"""
+    global _rollup_exclusions
+    if _rollup_exclusions is None:
+        _rollup_exclusions = frozenset( d.lower() for d in load_config().get( 'rollup_exclude', ROLLUP_EXCLUDE ) )
+    return _rollup_exclusions
+
+
+def include_in_rollup( description ):
+    return description.lower() not in rollup_exclusions()
+
+
+
 class Task( object ):
+    """A task started at start; tickets and descriptions are interned, since a history repeats them constantly"""
+
+    __slots__ = ( 'start', 'ticket', '_description', '_rollup' )
+
     def __init__( self, start, ticket, description ):
         self.start = start
-        self.ticket = ticket
-        self.description = description.strip()
+        self.ticket = sys.intern( ticket ) if isinstance( ticket, str ) else ticket
+        self.description = description
+
+    @property
+    def description( self ):
+        return self._description
+
+    @description.setter
+    def description( self, description ):
+        self._description = sys.intern( description.strip() )
+        self._rollup = None
 
     def include_in_rollup( self ):
-        if self.description.lower() == 'lunch':
-            return False
-        if self.description.lower() == 'break':
-            return False
-        return True
+        if self._rollup is None:
+            self._rollup = include_in_rollup( self._description )
+        return self._rollup
 
 
 
 class GoHome( object ):
+    __slots__ = ( 'start', )
+
     def __init__( self, start, *unused ):
         self.start = start
 
 
 
 class DummyRightNow( Task ):
-    def __init__( self ):
-        super( DummyRightNow, self ).__init__( start = now(), ticket = '', description = '' )
+    """Where a task still running ends: now, or the end of the day it started if that's over"""
+    __slots__ = ()
+
+    def __init__( self, since = None ):
+        start = now()
+        if since is not None:
+            start = min( start, datetime.combine( since.date() + timedelta( days = 1 ), datetime.min.time() ) )
+        super( DummyRightNow, self ).__init__( start = start, ticket = '', description = '' )
+
+
+
+# everything lives in ~/.worklog unless WORKLOG_HOME or --root says otherwise
+WORKLOG_ROOT = os.path.expanduser( os.environ.get( 'WORKLOG_HOME', '~/.worklog' ) )
+
+day_file_re = re.compile( r'^(\d{4}-\d{2}-\d{2})-2\.(json|wlc|journal)$' )
+archive_file_re = re.compile( r'^\d{4}-\d{2}\.wla$' )
+
+def storage_path( *parts ):
+    """Path of a file inside the worklog storage directory"""
+    return os.path.join( WORKLOG_ROOT, *parts )
+
+
+def load_config():
+    """Contents of ~/.worklog/config.json, empty if there is none"""
+    try:
+        with open( storage_path( 'config.json' ) ) as json_data:
+            trace_count( 'file reads' )
+            return json.load( json_data )
+    except IOError as err:
+        if err.errno == errno.ENOENT:
+            return dict()
+        raise
+
+
+def day_path( when, suffix = 'json' ):
+    return storage_path( '{}-2.{}'.format( when.strftime( '%F' ), suffix ) )
+
+
+def archive_path( month ):
+    """Path of the archive of the YYYY-MM month"""
+    return storage_path( '{}.{}'.format( month, DayArchive.suffix ) )
+
+
+def day_stamp( when ):
+    """Stamp of a single day, as scan_days() would report it"""
+    return open_storage().stamp( when )
+
+
+def scan_days():
+    """Map the YYYY-MM-DD of every persisted worklog to its stamp, which changes whenever the day is written"""
+    return open_storage().scan()
+
+
+def write_atomically( path, data, mode = 0o644 ):
+    """Replace the file at path with data (bytes) so readers see either the old or the new content"""
+    directory = os.path.split( path )[0]
+    if not os.access( directory, os.F_OK ):
+        os.makedirs( directory, mode=0o755 )
+    temp_path = '{}.{}.tmp'.format( path, os.getpid() )
+    fd = os.open( temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode )
+    try:
+        with os.fdopen( fd, 'wb' ) as temp_file:
+            trace_count( 'file writes' )
+            trace_count( 'bytes written', len( data ) )
+            temp_file.write( data )
+            temp_file.flush()
+            os.fsync( temp_file.fileno() )
+        os.replace( temp_path, path )
+    except:
+        if os.access( temp_path, os.F_OK ):
+            os.unlink( temp_path )
+        raise
+
+
+def load_state( path, version, strict = False ):
+    """The json object saved at path by save_state() with version, None if there is none
+
+    A file saved with another version, or that isn't json, counts as none, so
+    that whatever it held is simply made again; unless strict, for state that
+    can't be, in which case a damaged file raises ValueError."""
+    try:
+        with open( path, 'r' ) as json_file:
+            trace_count( 'file reads' )
+            data = json.load( json_file )
+    except IOError as err:
+        if err.errno != errno.ENOENT:
+            raise
+        return None
+    except ValueError:
+        if strict:
+            raise
+        return None
+    if not isinstance( data, dict ) or data.get( 'version' ) != version:
+        return None
+    return data
+
+
+def save_state( path, version, data, mode = 0o644 ):
+    """Replace the file at path with data, a dict, as json tagged with version, see load_state()"""
+    data = dict( data, version = version )
+    write_atomically( path, json.dumps( data, separators = ( ',', ':' ) ).encode( 'utf-8' ), mode )
+
+
+EPOCH = datetime( 1970, 1, 1 )
+
+def to_epoch( when ):
+    """Naive datetime to whole seconds since EPOCH, no timezone conversion is done"""
+    return int( ( when - EPOCH ).total_seconds() )
+
+
+def from_epoch( seconds ):
+    return EPOCH + timedelta( seconds = seconds )
+
+
+def end_of_day( seconds ):
+    """The midnight ending the day of seconds, both in seconds since EPOCH"""
+    return seconds - seconds % 86400 + 86400
+
+
+
+JOURNAL_COMPACT_AFTER = 64
+LOAD_ATTEMPTS = 5
+
+def same_entry( a, b ):
+    return (
+        type( a ) is type( b ) and
+        a.start == b.start and
+        getattr( a, 'ticket', None ) == getattr( b, 'ticket', None ) and
+        getattr( a, 'description', None ) == getattr( b, 'description', None )
+    )
+
+
+def entry_key( entry ):
+    return ( type( entry ).__name__, entry.start, getattr( entry, 'ticket', None ), getattr( entry, 'description', None ) )
+
+
+
+class FileLock( object ):
+    """Advisory lock, an flock on the file at path, taken again by the same holder without blocking
+
+    Unless blocking, entering raises BlockingIOError while another process
+    holds the lock. Where there is no fcntl module, nothing is locked."""
+
+    def __init__( self, path, blocking = True ):
+        self.path = path
+        self.blocking = blocking
+        self.fd = None
+        self.depth = 0
+
+    def __enter__( self ):
+        if self.depth == 0:
+            try:
+                import fcntl
+            except ImportError:
+                fcntl = None
+            if fcntl is not None:
+                directory = os.path.split( self.path )[0]
+                if not os.access( directory, os.F_OK ):
+                    os.makedirs( directory, mode=0o755 )
+                fd = os.open( self.path, os.O_RDWR | os.O_CREAT, 0o644 )
+                try:
+                    fcntl.flock( fd, fcntl.LOCK_EX if self.blocking else fcntl.LOCK_EX | fcntl.LOCK_NB )
+                except:
+                    os.close( fd )
+                    raise
+                self.fd = fd
+        self.depth += 1
+        return self
+
+    def __exit__( self, *exc_info ):
+        self.depth -= 1
+        if self.depth == 0 and self.fd is not None:
+            # closing the file releases the lock
+            os.close( self.fd )
+            self.fd = None
+
+
+class DayLock( FileLock ):
+    """Advisory lock on the files of one day, held by every process while it writes them
+
+    The lock is an flock on ~/.worklog/locks/YYYY-MM-DD.lock."""
+
+    def __init__( self, when ):
+        super( DayLock, self ).__init__( storage_path( 'locks', '{}.lock'.format( when.strftime( '%F' ) ) ) )
 
 
 
 class Worklog( MutableSequence ):
-    def __init__( self, when = None ):
+    """The entries of one day, kept sorted by start time
+
+    A day is kept by a storage backend, open_storage() unless another is given.
+    With the default FileStorage, a day is persisted as a snapshot,
+    YYYY-MM-DD-2.json or the compact YYYY-MM-DD-2.wlc, plus an append-only
+    journal, YYYY-MM-DD-2.journal, holding one compact record per entry inserted
+    since the snapshot was written. save() appends just the new records with a
+    single fsync, and folds the journal back into the snapshot once it grows past
+    JOURNAL_COMPACT_AFTER records or when entries were replaced or removed.
+
+    Several processes can work on the same day: writes happen under the day's
+    lock, and a save first merges whatever was saved since the day was
+    loaded, going by the stamp of the day."""
+
+    def __init__( self, when = None, storage = None ):
         if when is None:
             self.when = date.today()
         elif isinstance( when, str ):
-            self.when = datetime.strptime( when, '%Y-%m-%d' ).date()
+            self.when = parse_date( when )
         else:
-            self.when = date
+            self.when = when
 
-        self.persist_path = os.path.expanduser( '~/.worklog/{}-2.json'.format( self.when.strftime( '%F' ) ) )
+        self.storage = storage or open_storage()
+        self.lock = self.storage.lock( self.when )
+        self.pending = list()
+        with traced( 'load day' ):
+            self.load()
 
-        try:
-            with open( self.persist_path, 'r' ) as json_file:
-                self.store = json.load( json_file, object_hook = dict_to_object )
-        except IOError as err:
-            if err.errno == errno.ENOENT:
-                self.store = list()
-            else:
-                raise
+    def load( self ):
+        """Read the day from disk, see read()
+
+        Nothing is locked for reading: if a save changed the day meanwhile,
+        it is read again, and after LOAD_ATTEMPTS tries, under the lock."""
+        for attempt in range( LOAD_ATTEMPTS ):
+            stamp = self.storage.stamp( self.when )
+            try:
+                self.read()
+            except IOError as err:
+                # a snapshot replaced by one in another format
+                if err.errno != errno.ENOENT:
+                    raise
+                continue
+            if self.storage.stamp( self.when ) == stamp:
+                break
+        else:
+            with self.lock:
+                stamp = self.storage.stamp( self.when )
+                self.read()
+        self.stamp = stamp
+        self.loaded = list( self.store )
+
+    def read( self ):
+        self.rewrite = False
+        self.store = list()
+        self.storage.read( self )
+
+    def refresh( self ):
+        """Catch up with what other processes saved since the day was loaded, returns whether anything changed
+
+        When the storage can tell what they appended, like the journal of day
+        files, only that is read; otherwise the day is loaded again. Unsaved
+        changes are dropped, which takes loading the day again too, since the
+        store still holds them."""
+        stamp = self.storage.stamp( self.when )
+        if stamp == self.stamp:
+            return False
+
+        unsaved = self.pending or self.rewrite
+        self.pending = list()
+        if not unsaved and self.storage.read_appended( self, stamp ):
+            if self.storage.stamp( self.when ) == stamp:
+                self.stamp = stamp
+                self.loaded = list( self.store )
+                return True
+        with traced( 'load day' ):
+            self.load()
+        return True
+
+    def merge( self ):
+        """Fold in what other processes saved since the day was loaded, holding the lock
+
+        Entries they added or removed are added or removed here as well, then
+        the entries added or removed here since loading are applied again."""
+        loaded = set( map( entry_key, self.loaded ) )
+        kept = set( map( entry_key, self.store ) )
+        added = [ entry for entry in self.store if entry_key( entry ) not in loaded ]
+        rewrite = self.rewrite
+
+        self.read()
+        self.stamp = self.storage.stamp( self.when )
+        self.loaded = list( self.store )
+        self.rewrite = self.rewrite or rewrite
+        self.store = [ entry for entry in self.store if entry_key( entry ) not in loaded or entry_key( entry ) in kept ]
+        if len( self.store ) != len( self.loaded ):
+            self.rewrite = True
+
+        present = set( map( entry_key, self.store ) )
+        for entry in added:
+            if entry_key( entry ) not in present:
+                self.store.insert( self.position( entry.start ), entry )
 
     def __getitem__( self, *args ):
         return self.store.__getitem__( *args )
 
     def __setitem__( self, *args ):
+        self.rewrite = True
         return self.store.__setitem__( *args )
 
     def __delitem__( self, *args):
+        self.rewrite = True
         return self.store.__delitem__( *args )
 
     def __len__( self, *args ):
         return self.store.__len__( *args )
 
+    def position( self, start ):
+        """Index at which an entry starting at start belongs, after any entries with the same start"""
+        lo, hi = 0, len( self.store )
+        while lo < hi:
+            mid = ( lo + hi ) // 2
+            if start < self.store[mid].start:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
     def insert( self, *args ):
-        value = self.store.append( *args )
-        self.store.sort( key = lambda t: t.start )
-        return value
+        """Add an entry in start time order; any index argument is ignored"""
+        value = args[-1]
+        self.store.insert( self.position( value.start ), value )
+        self.pending.append( value )
+
+    def replay( self, entry ):
+        """Add an entry read back from the journal, it is persisted already"""
+        self.store.insert( self.position( entry.start ), entry )
 
     def save( self ):
-        directory = os.path.split( self.persist_path )[0]
-        if not os.access( directory, os.F_OK ):
-            os.makedirs( directory, mode=0o755 )
-        with open( self.persist_path, 'w' ) as json_file:
-            json.dump( self.store, json_file, cls = KlassEncoder, indent = 4 )
+        """Persist the changes, merging in those other processes saved since the day was loaded"""
+        changed = self.rewrite or self.pending
+        with traced( 'save day' ), self.lock:
+            if self.storage.stamp( self.when ) != self.stamp:
+                self.merge()
+
+            if self.rewrite or self.pending:
+                self.storage.save( self )
+                self.written()
+
+        if changed:
+            load_summaries().record( self )
+
+    def compact( self, codec = None ):
+        """Write the whole day again, for day files as a new snapshot in codec's format, dropping the journal"""
+        with traced( 'compact day' ), self.lock:
+            if self.storage.stamp( self.when ) != self.stamp:
+                self.merge()
+            self.storage.write( self, codec )
+            self.written()
+
+    def written( self ):
+        """Note that the storage now holds exactly the entries in memory"""
+        self.pending = list()
+        self.rewrite = False
+        self.stamp = self.storage.stamp( self.when )
+        self.loaded = list( self.store )
 
     def pairwise( self ):
         offset = self.store[1:]
-        offset.append( DummyRightNow() )
+        offset.append( DummyRightNow( self.store[-1].start if self.store else None ) )
         return zip( self.store, offset )
 
 
@@ -378,10 +862,18 @@ class KlassEncoder( json.JSONEncoder ):
     """Encodes Task objects and datetime objects to JSON using __klass__ indicator key"""
 
     def default( self, obj ):
-        if isinstance( obj, ( Task, GoHome ) ):
-            d = obj.__dict__.copy()
-            d['__klass__'] = type( obj ).__name__
-            return d
+        if isinstance( obj, Task ):
+            return {
+                'start' : obj.start,
+                'ticket' : obj.ticket,
+                'description' : obj.description,
+                '__klass__' : type( obj ).__name__,
+            }
+        elif isinstance( obj, GoHome ):
+            return {
+                'start' : obj.start,
+                '__klass__' : type( obj ).__name__,
+            }
         elif isinstance( obj, datetime ):
             return {
                 '__klass__' : 'datetime',
@@ -417,11 +909,1113 @@ def dict_to_object( d ):
 
 
 
+class JsonCodec( object ):
+    """The original snapshot format, YYYY-MM-DD-2.json, easy to read and edit by hand"""
+
+    suffix = 'json'
+
+    @staticmethod
+    def dumps( store ):
+        return json.dumps( store, cls = KlassEncoder, indent = 4 ).encode( 'utf-8' )
+
+    @staticmethod
+    def loads( data ):
+        return json.loads( data.decode( 'utf-8' ), object_hook = dict_to_object )
+
+
+
+class CompactCodec( object ):
+    """Binary snapshot format, YYYY-MM-DD-2.wlc
+
+    A header holding the schema magic, the number of strings and the number of
+    entries is followed by the length-prefixed UTF-8 strings, each stored once,
+    and then one fixed size record per entry: its kind, its start in whole
+    seconds since EPOCH, and the ids of its ticket and description. String id 0
+    stands for None. Snapshots of the first version, with starts in whole
+    minutes, are still read."""
+
+    suffix = 'wlc'
+
+    MAGIC = b'WLC\x02'
+    HEADER = struct.Struct( '<4sII' )
+    LENGTH = struct.Struct( '<I' )
+    RECORD = struct.Struct( '<BqII' )
+
+    MINUTES_MAGIC = b'WLC\x01'
+    MINUTES_RECORD = struct.Struct( '<BiII' )
+
+    TASK = 0
+    GOHOME = 1
+
+    @staticmethod
+    def dumps( store ):
+        strings = list()
+        string_ids = { None: 0 }
+        records = list()
+
+        for entry in store:
+            seconds = to_epoch( entry.start )
+            if isinstance( entry, GoHome ):
+                records.append( CompactCodec.RECORD.pack( CompactCodec.GOHOME, seconds, 0, 0 ) )
+                continue
+
+            ids = list()
+            for value in ( entry.ticket, entry.description ):
+                if value not in string_ids:
+                    strings.append( value )
+                    string_ids[value] = len( strings )
+                ids.append( string_ids[value] )
+            records.append( CompactCodec.RECORD.pack( CompactCodec.TASK, seconds, *ids ) )
+
+        parts = [ CompactCodec.HEADER.pack( CompactCodec.MAGIC, len( strings ), len( records ) ) ]
+        for value in strings:
+            encoded = value.encode( 'utf-8' )
+            parts.append( CompactCodec.LENGTH.pack( len( encoded ) ) )
+            parts.append( encoded )
+        parts.extend( records )
+        return b''.join( parts )
+
+    @staticmethod
+    def loads( data ):
+        magic, string_count, entry_count = CompactCodec.HEADER.unpack_from( data, 0 )
+        if magic == CompactCodec.MAGIC:
+            record, unit = CompactCodec.RECORD, 1
+        elif magic == CompactCodec.MINUTES_MAGIC:
+            record, unit = CompactCodec.MINUTES_RECORD, 60
+        else:
+            raise ValueError( 'not a compact worklog, or an unknown version of one' )
+
+        offset = CompactCodec.HEADER.size
+        strings = [ None ]
+        for _ in range( string_count ):
+            length, = CompactCodec.LENGTH.unpack_from( data, offset )
+            offset += CompactCodec.LENGTH.size
+            strings.append( data[offset:offset + length].decode( 'utf-8' ) )
+            offset += length
+
+        store = list()
+        records = memoryview( data )[offset:offset + entry_count * record.size]
+        for kind, when, ticket, description in record.iter_unpack( records ):
+            start = EPOCH + timedelta( seconds = when * unit )
+            if kind == CompactCodec.GOHOME:
+                store.append( GoHome( start ) )
+            else:
+                store.append( Task( start, strings[ticket], strings[description] ) )
+        return store
+
+
+# newest format first, it wins when looking for a day's snapshot
+SNAPSHOT_CODECS = ( CompactCodec, JsonCodec )
+SNAPSHOT_FORMATS = { 'compact': CompactCodec, 'json': JsonCodec }
+
+
+
+class DayArchive( object ):
+    """The snapshots of the days of one month packed into a single file, YYYY-MM.wla
+
+    A header holding the magic, the year, the month and the number of days is
+    followed by a table giving each day of the month with the codec, offset
+    and length of its snapshot, then by the snapshots themselves, one after
+    another. The file is mapped into memory, reading a day only touches the
+    table and that day's bytes."""
+
+    suffix = 'wla'
+
+    MAGIC = b'WLA\x01'
+    HEADER = struct.Struct( '<4sHBB' )
+    ENTRY = struct.Struct( '<BBII' )
+
+    CODECS = ( JsonCodec, CompactCodec )
+
+    def __init__( self, path ):
+        import mmap
+
+        self.path = path
+        with open( path, 'rb' ) as archive_file:
+            trace_count( 'file reads' )
+            stat = os.fstat( archive_file.fileno() )
+            self.stamp = [ self.suffix, stat.st_mtime_ns, stat.st_size ]
+            self.data = mmap.mmap( archive_file.fileno(), 0, access = mmap.ACCESS_READ )
+
+        magic, year, month, count = self.HEADER.unpack_from( self.data, 0 )
+        if magic != self.MAGIC:
+            raise ValueError( '{} is not a worklog archive, or an unknown version of one'.format( path ) )
+        self.days = dict()
+        for idx in range( count ):
+            day, codec, offset, length = self.ENTRY.unpack_from( self.data, self.HEADER.size + idx * self.ENTRY.size )
+            self.days[date( year, month, day ).strftime( '%F' )] = ( self.CODECS[codec], offset, length )
+
+    def read( self, day ):
+        """( codec, entries, checksum of the snapshot ) of the YYYY-MM-DD day"""
+        codec, offset, length = self.days[day]
+        trace_count( 'bytes read', length )
+        data = self.data[offset:offset + length]
+        with traced( 'decode snapshot' ):
+            return codec, codec.loads( data ), zlib.crc32( data )
+
+    @classmethod
+    def pack( cls, year, month, snapshots ):
+        """Archive holding snapshots, ( day of the month, codec, encoded entries ) of each day"""
+        table = list()
+        offset = cls.HEADER.size + len( snapshots ) * cls.ENTRY.size
+        for day, codec, data in snapshots:
+            table.append( cls.ENTRY.pack( day, cls.CODECS.index( codec ), offset, len( data ) ) )
+            offset += len( data )
+        return b''.join( [ cls.HEADER.pack( cls.MAGIC, year, month, len( snapshots ) ) ] + table + [ data for day, codec, data in snapshots ] )
+
+
+
+def fold_journal( when, data ):
+    """Note in the journal of the day when, if it has one, that a snapshot of data is about to take in its records"""
+    try:
+        fd = os.open( day_path( when, 'journal' ), os.O_WRONLY | os.O_APPEND )
+    except IOError as err:
+        if err.errno == errno.ENOENT:
+            return
+        raise
+    try:
+        # on a line of its own, even after a torn record
+        note = '\n{}\n'.format( json.dumps( { 'folded': zlib.crc32( data ) } ) ).encode( 'utf-8' )
+        trace_count( 'file writes' )
+        trace_count( 'bytes written', len( note ) )
+        os.write( fd, note )
+        os.fsync( fd )
+    finally:
+        os.close( fd )
+
+
+
+class FileStorage( object ):
+    """Days kept in files of their own, a snapshot and a journal each, see Worklog
+
+    The snapshots of closed months can be packed into a DayArchive, a day's
+    own files win over its snapshot in the archive. A day's stamp is
+    [ suffix, mtime_ns, size ] of each of its files, and writers hold its
+    DayLock. The worklogs it reads remember which snapshot they came from,
+    codec, persist_path and whether it was archived, the snapshot_checksum of
+    its bytes, and how much of the journal they read, journal_length records or
+    journal_offset bytes.
+
+    Before writing a snapshot that takes in the journal, the checksum of the
+    snapshot is noted in the journal. When that snapshot is the one read, the
+    records before the note are already in it: they belong to a journal left
+    behind by a compaction that was interrupted before removing it."""
+
+    name = 'files'
+
+    def __init__( self ):
+        self.archives = dict()
+
+    def open_archive( self, path, stamp ):
+        """The DayArchive at path, whose file has stamp, or None for no file"""
+        archive = self.archives.get( path )
+        if stamp is None:
+            self.archives.pop( path, None )
+            return None
+        if archive is None or archive.stamp != stamp:
+            archive = self.archives[path] = DayArchive( path )
+        return archive
+
+    def archive( self, day ):
+        """The DayArchive of the month of the YYYY-MM-DD day, None when there is none"""
+        path = archive_path( day[:7] )
+        try:
+            stat = os.stat( path )
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return self.open_archive( path, None )
+        return self.open_archive( path, [ DayArchive.suffix, stat.st_mtime_ns, stat.st_size ] )
+
+    def stamp( self, when ):
+        # stamps are taken several times for every day loaded or saved, the paths are only put together once
+        day = when.strftime( '%F' )
+        base = day_path( when, '' )
+        stamp = list()
+        for suffix in ( 'journal', 'json', 'wlc' ):
+            try:
+                stat = os.stat( base + suffix )
+            except IOError as err:
+                if err.errno == errno.ENOENT: continue
+                raise
+            stamp.append( [ suffix, stat.st_mtime_ns, stat.st_size ] )
+        archive = self.archive( day )
+        if archive is not None and day in archive.days:
+            stamp.append( archive.stamp )
+            stamp.sort()
+        return stamp
+
+    def scan( self ):
+        days = dict()
+        try:
+            entries = list( os.scandir( WORKLOG_ROOT ) )
+        except IOError as err:
+            if err.errno == errno.ENOENT:
+                return days
+            raise
+
+        for entry in entries:
+            match = day_file_re.match( entry.name )
+            if match is not None:
+                stat = entry.stat()
+                days.setdefault( match.group( 1 ), list() ).append( [ match.group( 2 ), stat.st_mtime_ns, stat.st_size ] )
+            elif archive_file_re.match( entry.name ):
+                stat = entry.stat()
+                archive = self.open_archive( entry.path, [ DayArchive.suffix, stat.st_mtime_ns, stat.st_size ] )
+                for day in archive.days:
+                    days.setdefault( day, list() ).append( archive.stamp )
+        for stamp in days.values():
+            stamp.sort()
+        return days
+
+    def lock( self, when ):
+        return DayLock( when )
+
+    def read( self, worklog ):
+        worklog.codec = None
+        worklog.persist_path = None
+        worklog.archived = False
+        worklog.snapshot_checksum = None
+        worklog.journal_length = 0
+        worklog.journal_offset = 0
+
+        # a day has one snapshot, unless a change of format was interrupted, then the newer one is current
+        base = day_path( worklog.when, '' )
+        snapshots = list()
+        for codec in SNAPSHOT_CODECS:
+            try:
+                snapshots.append( ( os.stat( base + codec.suffix ).st_mtime_ns, codec ) )
+            except IOError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+        if snapshots:
+            worklog.codec = max( snapshots, key = lambda snapshot: snapshot[0] )[1]
+            worklog.persist_path = base + worklog.codec.suffix
+            with open( worklog.persist_path, 'rb' ) as snapshot_file:
+                data = snapshot_file.read()
+            trace_count( 'file reads' )
+            trace_count( 'bytes read', len( data ) )
+            with traced( 'decode snapshot' ):
+                worklog.store = worklog.codec.loads( data )
+            worklog.snapshot_checksum = zlib.crc32( data )
+        else:
+            day = worklog.when.strftime( '%F' )
+            archive = self.archive( day )
+            if archive is not None and day in archive.days:
+                worklog.codec, worklog.store, worklog.snapshot_checksum = archive.read( day )
+                worklog.archived = True
+
+        self.read_journal( worklog )
+
+    def read_journal( self, worklog ):
+        """Replay the journal records past the worklog's journal_offset, the bytes of it already read
+
+        Records up to a note of the snapshot read are in it already and
+        skipped. Returns False when such a note turns up past records replayed
+        before, then the day has to be read again."""
+        records = list()
+        try:
+            with open( day_path( worklog.when, 'journal' ), 'rb' ) as journal_file, traced( 'replay journal' ):
+                trace_count( 'file reads' )
+                journal_file.seek( worklog.journal_offset )
+                for line in journal_file:
+                    if not line.endswith( b'\n' ):
+                        # a torn record from an interrupted append, rewriting drops it
+                        worklog.rewrite = True
+                        break
+                    try:
+                        record = json.loads( line, object_hook = dict_to_object ) if line.strip() else None
+                    except ValueError:
+                        # torn too, and followed by the note of the compaction that dropped it
+                        worklog.rewrite = True
+                        record = None
+                    records.append( ( len( line ), record ) )
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+
+        folded = None
+        for idx, ( length, record ) in enumerate( records ):
+            if isinstance( record, dict ) and record.get( 'folded' ) == worklog.snapshot_checksum:
+                folded = idx
+        if folded is not None:
+            if worklog.journal_offset:
+                return False
+            # left behind by an interrupted compaction, the next save drops it
+            worklog.rewrite = True
+
+        for idx, ( length, record ) in enumerate( records ):
+            worklog.journal_offset += length
+            # notes of snapshots, and torn records
+            if record is None or isinstance( record, dict ): continue
+            worklog.journal_length += 1
+            if folded is None or idx > folded:
+                worklog.replay( record )
+        return True
+
+    def read_appended( self, worklog, stamp ):
+        """Read only the records appended to the journal, if that's all that changed since worklog was read"""
+        snapshots = lambda stamp: [ part for part in stamp if part[0] != 'journal' ]
+        journal_size = lambda stamp: sum( part[2] for part in stamp if part[0] == 'journal' )
+        if snapshots( stamp ) != snapshots( worklog.stamp ) or journal_size( stamp ) <= worklog.journal_offset:
+            return False
+        return self.read_journal( worklog )
+
+    def save( self, worklog ):
+        if worklog.rewrite or worklog.journal_length + len( worklog.pending ) > JOURNAL_COMPACT_AFTER:
+            with traced( 'compact day' ):
+                self.write( worklog )
+            return
+
+        path = day_path( worklog.when, 'journal' )
+        records = ''.join( json.dumps( entry, cls = KlassEncoder, separators = ( ',', ':' ) ) + '\n' for entry in worklog.pending )
+        directory = os.path.split( path )[0]
+        if not os.access( directory, os.F_OK ):
+            os.makedirs( directory, mode=0o755 )
+        fd = os.open( path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644 )
+        try:
+            records = records.encode( 'utf-8' )
+            trace_count( 'file writes' )
+            trace_count( 'bytes written', len( records ) )
+            os.write( fd, records )
+            os.fsync( fd )
+        finally:
+            os.close( fd )
+        worklog.journal_length += len( worklog.pending )
+        worklog.journal_offset += len( records )
+
+    def write( self, worklog, codec = None ):
+        """Write the day as a new snapshot and drop the journal
+
+        The snapshot keeps its current format unless another codec is given; a
+        new day uses the "format" from the config file, json by default."""
+        if codec is None:
+            codec = worklog.codec or SNAPSHOT_FORMATS[load_config().get( 'format', 'json' )]
+        path = day_path( worklog.when, codec.suffix )
+        data = codec.dumps( worklog.store )
+        fold_journal( worklog.when, data )
+        write_atomically( path, data )
+        worklog.snapshot_checksum = zlib.crc32( data )
+        if worklog.persist_path is not None and worklog.persist_path != path:
+            os.unlink( worklog.persist_path )
+        worklog.codec = codec
+        worklog.persist_path = path
+        worklog.archived = False
+
+        try:
+            os.unlink( day_path( worklog.when, 'journal' ) )
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+        worklog.journal_length = 0
+        worklog.journal_offset = 0
+
+
+
+class SqliteStorage( object ):
+    """Every day in one SQLite database, ~/.worklog/worklog.sqlite3
+
+    Entries are rows indexed by day and start, for range reports, and by
+    ticket regardless of case, for searches by ticket, and can also be queried
+    directly with the sqlite3 shell. The database is in WAL mode, readers never
+    wait for writers, and writers take turns in immediate transactions, which
+    stand in for day locks. Every write of a day sets its revision, its stamp,
+    to a new, larger value."""
+
+    name = 'sqlite'
+    FILENAME = 'worklog.sqlite3'
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS days (
+            day TEXT PRIMARY KEY,
+            revision INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY,
+            day TEXT NOT NULL,
+            start INTEGER NOT NULL,
+            gohome INTEGER NOT NULL,
+            ticket TEXT,
+            description TEXT
+        );
+        CREATE INDEX IF NOT EXISTS entries_day_start ON entries ( day, start );
+        CREATE INDEX IF NOT EXISTS entries_ticket_nocase ON entries ( ticket COLLATE NOCASE );
+        DROP INDEX IF EXISTS entries_start;
+        DROP INDEX IF EXISTS entries_ticket;
+        DROP INDEX IF EXISTS entries_description;
+    """
+
+    def __init__( self ):
+        self.path = storage_path( self.FILENAME )
+        self.database = None
+        self.depth = 0
+
+    def connect( self ):
+        if self.database is None:
+            import sqlite3
+
+            directory = os.path.split( self.path )[0]
+            if not os.access( directory, os.F_OK ):
+                os.makedirs( directory, mode=0o755 )
+            # transactions are begun explicitly, by __enter__
+            database = sqlite3.connect( self.path, timeout = 30, isolation_level = None )
+            database.execute( 'PRAGMA journal_mode = WAL' )
+            database.executescript( self.SCHEMA )
+            self.database = database
+        return self.database
+
+    def query( self, sql, *parameters ):
+        trace_count( 'database queries' )
+        return self.connect().execute( sql, parameters )
+
+    def __enter__( self ):
+        if self.depth == 0:
+            self.query( 'BEGIN IMMEDIATE' )
+        self.depth += 1
+        return self
+
+    def __exit__( self, exc_type, *exc_info ):
+        self.depth -= 1
+        if self.depth == 0:
+            self.query( 'COMMIT' if exc_type is None else 'ROLLBACK' )
+
+    def stamp( self, when ):
+        row = self.query( 'SELECT revision FROM days WHERE day = ?', when.strftime( '%F' ) ).fetchone()
+        return row[0] if row is not None else None
+
+    def scan( self ):
+        return dict( self.query( 'SELECT day, revision FROM days' ) )
+
+    def lock( self, when ):
+        # one transaction covers the whole database, taken again by the same holder without blocking
+        return self
+
+    def read( self, worklog ):
+        rows = self.query( 'SELECT start, gohome, ticket, description FROM entries WHERE day = ? ORDER BY start, id', worklog.when.strftime( '%F' ) )
+        for start, gohome, ticket, description in rows:
+            if gohome:
+                worklog.store.append( GoHome( start = from_epoch( start ) ) )
+            else:
+                worklog.store.append( Task( start = from_epoch( start ), ticket = ticket, description = description ) )
+
+    def read_appended( self, worklog, stamp ):
+        return False
+
+    def columns( self, first = None, last = None, tickets = () ):
+        """( ( YYYY-MM-DD, DayColumns ) pairs, strings ) of the days from first to last, YYYY-MM-DD, in order
+
+        With tickets, only the days using any of them, regardless of case, are
+        read. Days without entries are left out."""
+        conditions = list()
+        parameters = list()
+        if first is not None:
+            conditions.append( 'day >= ?' )
+            parameters.append( first )
+        if last is not None:
+            conditions.append( 'day <= ?' )
+            parameters.append( last )
+        if tickets:
+            conditions.append( 'day IN ( SELECT day FROM entries WHERE ticket COLLATE NOCASE IN ( {} ) )'.format( ', '.join( '?' * len( tickets ) ) ) )
+            parameters.extend( tickets )
+        where = ' WHERE {}'.format( ' AND '.join( conditions ) ) if conditions else ''
+        rows = self.query( 'SELECT day, revision, start, gohome, ticket, description FROM entries JOIN days USING ( day ){} ORDER BY day, start, id'.format( where ), *parameters )
+
+        table = StringTable()
+        days = list()
+        for day, revision, start, gohome, ticket, description in rows:
+            if not days or days[-1][0] != day:
+                days.append( ( day, DayColumns( revision ) ) )
+            columns = days[-1][1]
+            columns.starts.append( start )
+            if gohome:
+                columns.tickets.append( StringTable.NONE )
+                columns.descriptions.append( DayColumns.GOHOME )
+            else:
+                columns.tickets.append( table.intern( ticket ) )
+                columns.descriptions.append( table.intern( description ) )
+        return days, table.strings
+
+    def save( self, worklog ):
+        if worklog.rewrite:
+            self.write( worklog )
+        else:
+            with self:
+                self.insert( worklog.when, worklog.pending )
+
+    def write( self, worklog, codec = None ):
+        """Replace every entry of the day, there's only the one format"""
+        with self:
+            self.query( 'DELETE FROM entries WHERE day = ?', worklog.when.strftime( '%F' ) )
+            self.insert( worklog.when, worklog.store )
+
+    def insert( self, when, entries ):
+        day = when.strftime( '%F' )
+        rows = list()
+        for entry in entries:
+            if isinstance( entry, GoHome ):
+                rows.append( ( day, to_epoch( entry.start ), 1, None, None ) )
+            else:
+                rows.append( ( day, to_epoch( entry.start ), 0, entry.ticket, entry.description ) )
+        trace_count( 'database queries' )
+        self.connect().executemany( 'INSERT INTO entries ( day, start, gohome, ticket, description ) VALUES ( ?, ?, ?, ?, ? )', rows )
+        # a clock reading rather than a count, so a day keeps changing stamp even if the database is made anew
+        self.query( 'INSERT INTO days ( day, revision ) VALUES ( ?, ? ) ON CONFLICT ( day ) DO UPDATE SET revision = MAX( revision + 1, excluded.revision )',
+            day, time_ns() )
+
+
+STORAGE_BACKENDS = { 'files': FileStorage, 'sqlite': SqliteStorage }
+
+_storages = dict()
+# a database connection must not be used by both sides of a fork, where there are forks
+if hasattr( os, 'register_at_fork' ):
+    os.register_at_fork( after_in_child = _storages.clear )
+
+def open_storage():
+    """The storage backend of WORKLOG_ROOT, "storage" in its config file, files by default"""
+    storage = _storages.get( WORKLOG_ROOT )
+    if storage is None:
+        storage = _storages[WORKLOG_ROOT] = STORAGE_BACKENDS[load_config().get( 'storage', 'files' )]()
+    return storage
+
+
+
+
+class DayColumns( object ):
+    """One day's entries as parallel arrays of start times (epoch seconds), ticket ids and description ids"""
+
+    __slots__ = ( 'stamp', 'starts', 'tickets', 'descriptions' )
+
+    # description id of a GoHome entry
+    GOHOME = -1
+
+    def __init__( self, stamp, starts = (), tickets = (), descriptions = () ):
+        self.stamp = stamp
+        self.starts = array( 'q', starts )
+        self.tickets = array( 'l', tickets )
+        self.descriptions = array( 'l', descriptions )
+
+    def ends( self, current ):
+        """End of each entry: the start of the next one, or current for the last, though no later than the end of its day"""
+        ends = self.starts[1:]
+        if self.starts:
+            ends.append( min( current, end_of_day( self.starts[-1] ) ) )
+        return ends
+
+    def to_json( self ):
+        return [ self.stamp, self.starts.tolist(), self.tickets.tolist(), self.descriptions.tolist() ]
+
+    def closed( self, current ):
+        """Whether the day's time is settled at current, epoch seconds: it has no entries, ends with a GoHome, or is
+        over, so nothing runs on with the clock"""
+        return not self.descriptions or self.descriptions[-1] == DayColumns.GOHOME or end_of_day( self.starts[-1] ) <= current
+
+    @classmethod
+    def from_worklog( cls, worklog, table, stamp = None ):
+        """Columns of the worklog's entries, with their strings interned into table"""
+        columns = cls( stamp )
+        for task in worklog:
+            columns.starts.append( to_epoch( task.start ) )
+            if isinstance( task, GoHome ):
+                columns.tickets.append( StringTable.NONE )
+                columns.descriptions.append( DayColumns.GOHOME )
+            else:
+                columns.tickets.append( table.intern( task.ticket ) )
+                columns.descriptions.append( table.intern( task.description ) )
+        return columns
+
+
+
+class StringTable( object ):
+    """Interns strings to small integer ids, id NONE stands for None"""
+
+    NONE = 0
+
+    def __init__( self, strings = None ):
+        self.strings = strings or [ None ]
+        self.ids = { value: idx for idx, value in enumerate( self.strings ) }
+
+    def intern( self, value ):
+        try:
+            return self.ids[value]
+        except KeyError:
+            self.ids[value] = len( self.strings )
+            self.strings.append( value )
+            return self.ids[value]
+
+
+
+token_re = re.compile( r'\w+(?:[-.]\w+)*' )
+
+def tokenize( value ):
+    """Lowercased words of value, a word may contain - or . so tickets like PROJ-123 stay whole"""
+    return set( token.lower() for token in token_re.findall( value ) )
+
+
+
+class HistoryIndex( object ):
+    """Columnar index of every persisted worklog, kept in ~/.worklog/index.json
+
+    Tickets and descriptions are interned into one string table shared by all
+    days. refresh() only re-parses the days whose file stamp changed since they
+    were last indexed.
+
+    For search(), postings maps every string id to the days using it, and is
+    kept up to date as days are re-indexed; the words of each string are
+    tokenized into tokens once, the first time a search needs them."""
+
+    VERSION = 2
+
+    def __init__( self, path = None ):
+        self.path = path or storage_path( 'index.json' )
+        self.reset()
+
+        # a missing, outdated or damaged index is simply rebuilt by the next refresh
+        data = load_state( self.path, self.VERSION )
+        if data is None:
+            self.dirty = True
+        else:
+            self.table = StringTable( data['strings'] )
+            self.days = { day: DayColumns( *columns ) for day, columns in data['days'].items() }
+            self.postings = { int( idx ): set( days ) for idx, days in data['postings'].items() }
+
+    @classmethod
+    def from_days( cls, days, strings ):
+        """An index of just days, ( YYYY-MM-DD, DayColumns ) pairs whose ids refer to strings, never saved"""
+        index = cls.__new__( cls )
+        index.path = None
+        index.reset()
+        index.table = StringTable( strings )
+        for day, columns in days:
+            index.replace_day( day, columns )
+        index.dirty = False
+        return index
+
+    def reset( self ):
+        self.table = StringTable()
+        self.days = dict()
+        self.postings = dict()
+        self.tokens = dict()
+        self.tokenized = 0
+        self.dirty = False
+
+    @property
+    def strings( self ):
+        return self.table.strings
+
+    def refresh( self ):
+        """Bring the index up to date with the day files on disk, saving it if anything changed"""
+        with traced( 'refresh index' ):
+            found = scan_days()
+
+            for day in set( self.days ).difference( found ):
+                self.replace_day( day, None )
+
+            for day, stamp in found.items():
+                columns = self.days.get( day )
+                if columns is not None and columns.stamp == stamp: continue
+                self.replace_day( day, DayColumns.from_worklog( Worklog( when = day ), self.table, stamp ) )
+
+            if self.dirty:
+                self.save()
+
+    def rebuild( self ):
+        """Index every day again from scratch"""
+        self.reset()
+        self.dirty = True
+        self.refresh()
+
+    def replace_day( self, day, columns ):
+        old = self.days.pop( day, None )
+        if old is not None:
+            for idx in set( old.tickets ).union( old.descriptions ):
+                days = self.postings.get( idx )
+                if days is None: continue
+                days.discard( day )
+                if not days:
+                    del self.postings[idx]
+        if columns is not None:
+            self.days[day] = columns
+            for idx in set( columns.tickets ).union( columns.descriptions ):
+                if idx in ( StringTable.NONE, DayColumns.GOHOME ): continue
+                self.postings.setdefault( idx, set() ).add( day )
+        self.dirty = True
+
+    def save( self ):
+        save_state( self.path, self.VERSION, {
+            'strings': self.strings,
+            'days': { day: columns.to_json() for day, columns in self.days.items() },
+            'postings': { idx: sorted( days ) for idx, days in self.postings.items() },
+        } )
+        self.dirty = False
+
+    def between( self, first, last ):
+        """( YYYY-MM-DD, DayColumns ) for every indexed day from first to last inclusive, in order"""
+        first = first.strftime( '%F' )
+        last = last.strftime( '%F' )
+        for day in sorted( self.days ):
+            if first <= day <= last:
+                yield day, self.days[day]
+
+    def token_ids( self, term ):
+        """Ids of the strings containing every word of term, a term ending in * matches words by prefix"""
+        for idx in range( self.tokenized, len( self.strings ) ):
+            if self.strings[idx] is None: continue
+            for token in tokenize( self.strings[idx] ):
+                self.tokens.setdefault( token, set() ).add( idx )
+        self.tokenized = len( self.strings )
+
+        prefix = term.endswith( '*' )
+        ids = None
+        for word in tokenize( term ):
+            if prefix and term.lower().endswith( word + '*' ):
+                matches = set()
+                for token, token_ids in self.tokens.items():
+                    if token.startswith( word ):
+                        matches.update( token_ids )
+            else:
+                matches = self.tokens.get( word, set() )
+            ids = matches if ids is None else ids.intersection( matches )
+        return ids or set()
+
+    def search( self, terms = (), tickets = (), first = None, last = None, current = None ):
+        """( day, start, end, ticket, description ) of each task matching all terms and any of tickets
+
+        Every term has to appear in the ticket or the description of a task.
+        Tickets match whole and regardless of case. Starts and ends are epoch
+        seconds, an open task ends at current, defaulting to now, or at the end
+        of its day if that came first."""
+        if current is None:
+            current = to_epoch( now() )
+
+        wanted = [ self.token_ids( term ) for term in terms ]
+        ticket_ids = None
+        if tickets:
+            lowered = set( ticket.lower() for ticket in tickets )
+            ticket_ids = set( idx for idx, value in enumerate( self.strings ) if value is not None and value.lower() in lowered )
+            wanted.append( ticket_ids )
+
+        # only days using a string matching each of the filters can hold a match
+        candidates = None
+        for ids in wanted:
+            days = set()
+            for idx in ids:
+                days.update( self.postings.get( idx, () ) )
+            candidates = days if candidates is None else candidates.intersection( days )
+        if candidates is None:
+            candidates = self.days.keys()
+
+        first = first.strftime( '%F' ) if first else None
+        last = last.strftime( '%F' ) if last else None
+        for day in sorted( candidates ):
+            if first is not None and day < first: continue
+            if last is not None and day > last: continue
+
+            columns = self.days[day]
+            for start, end, ticket, description in zip( columns.starts, columns.ends( current ), columns.tickets, columns.descriptions ):
+                if description == DayColumns.GOHOME: continue
+                if ticket_ids is not None and ticket not in ticket_ids: continue
+                if all( ticket in ids or description in ids for ids in wanted ):
+                    yield day, start, end, self.strings[ticket], self.strings[description]
+
+
+
+class Aggregate( object ):
+    """Seconds spent over a set of days: in total, per description, per ticket and per day
+
+    Only entries included in rollups count toward the totals. Every description
+    and ticket of such an entry has a key, even with no time at all, like
+    report() always listed them, while days with no time are left out. When
+    asked for, durations holds the length of
+    every entry of each day, 0 for GoHome entries."""
+
+    def __init__( self ):
+        self.total = 0
+        self.descriptions = dict()
+        self.tickets = dict()
+        self.days = dict()
+        self.durations = dict()
+
+    def merge( self, other ):
+        """Add the totals of other, an Aggregate of other days, to these"""
+        self.total += other.total
+        for totals, more in ( ( self.days, other.days ), ( self.descriptions, other.descriptions ), ( self.tickets, other.tickets ) ):
+            for key, seconds in more.items():
+                totals[key] = totals.get( key, 0 ) + seconds
+
+
+# below this many entries importing numpy costs more than it saves
+AGGREGATE_VECTORIZE_AFTER = 20000
+
+def aggregate( days, strings, current = None, vectorize = None, durations = False ):
+    """Aggregate of ( YYYY-MM-DD, DayColumns ) pairs whose ids refer to strings
+
+    The last entry of a day, unless it is a GoHome, runs until current, epoch
+    seconds defaulting to now, or until the end of the day if that came first.
+    vectorize picks between numpy and pure python, by default numpy is used for
+    large inputs when it is installed. durations asks for the length of every
+    entry too."""
+    with traced( 'aggregate' ):
+        days = list( days )
+        if current is None:
+            current = to_epoch( now() )
+        eligible = [ value is not None and include_in_rollup( value ) for value in strings ]
+
+        if vectorize is None:
+            vectorize = sum( len( columns.starts ) for day, columns in days ) >= AGGREGATE_VECTORIZE_AFTER
+        if vectorize:
+            try:
+                import numpy
+            except ImportError:
+                pass
+            else:
+                return aggregate_numpy( numpy, days, strings, current, eligible, durations )
+        return aggregate_python( days, strings, current, eligible, durations )
+
+
+def aggregate_python( days, strings, current, eligible, keep_durations ):
+    result = Aggregate()
+    descriptions = dict()
+    tickets = dict()
+
+    for day, columns in days:
+        durations = array( 'q' )
+        day_total = 0
+        for start, end, ticket, description in zip( columns.starts, columns.ends( current ), columns.tickets, columns.descriptions ):
+            if description == DayColumns.GOHOME:
+                durations.append( 0 )
+                continue
+
+            seconds = end - start
+            durations.append( seconds )
+            if not eligible[description]: continue
+
+            day_total += seconds
+            descriptions[description] = descriptions.get( description, 0 ) + seconds
+            tickets[ticket] = tickets.get( ticket, 0 ) + seconds
+
+        if keep_durations:
+            result.durations[day] = durations
+        if day_total:
+            result.days[day] = day_total
+            result.total += day_total
+
+    result.descriptions = { strings[idx]: seconds for idx, seconds in descriptions.items() }
+    result.tickets = { strings[idx]: seconds for idx, seconds in tickets.items() }
+    return result
+
+
+def aggregate_numpy( numpy, days, strings, current, eligible, keep_durations ):
+    result = Aggregate()
+    if not days:
+        return result
+
+    counts = numpy.array( [ len( columns.starts ) for day, columns in days ], dtype = numpy.int64 )
+    starts = numpy.concatenate( [ numpy.frombuffer( columns.starts, dtype = numpy.int64 ) for day, columns in days ] )
+    tickets = numpy.concatenate( [ numpy.asarray( columns.tickets, dtype = numpy.int64 ) for day, columns in days ] )
+    descriptions = numpy.concatenate( [ numpy.asarray( columns.descriptions, dtype = numpy.int64 ) for day, columns in days ] )
+
+    # every entry ends where the next one starts, except the last of each day
+    ends = numpy.empty_like( starts )
+    ends[:-1] = starts[1:]
+    boundaries = numpy.cumsum( counts )
+    last = boundaries[counts > 0] - 1
+    ends[last] = numpy.minimum( current, starts[last] - starts[last] % 86400 + 86400 )
+
+    gohome = descriptions == DayColumns.GOHOME
+    descriptions = numpy.where( gohome, StringTable.NONE, descriptions )
+    durations = numpy.where( gohome, 0, ends - starts )
+    included = numpy.asarray( eligible, dtype = bool )[descriptions] & ~gohome
+    counted = numpy.where( included, durations, 0 )
+
+    by_description = numpy.bincount( descriptions, weights = counted, minlength = len( strings ) )
+    by_ticket = numpy.bincount( tickets, weights = counted, minlength = len( strings ) )
+    by_day = numpy.bincount( numpy.repeat( numpy.arange( len( days ) ), counts ), weights = counted, minlength = len( days ) )
+
+    if keep_durations:
+        for ( day, columns ), day_durations in zip( days, numpy.split( durations, boundaries[:-1] ) ):
+            result.durations[day] = array( 'q', day_durations.tolist() )
+    for ( day, columns ), day_total in zip( days, by_day ):
+        if day_total:
+            result.days[day] = int( day_total )
+    result.total = int( by_day.sum() )
+    # keys of included entries are kept even when their time adds up to nothing
+    seen_descriptions = numpy.bincount( descriptions[included], minlength = len( strings ) )
+    seen_tickets = numpy.bincount( tickets[included], minlength = len( strings ) )
+    result.descriptions = { strings[idx]: int( by_description[idx] ) for idx in numpy.flatnonzero( seen_descriptions ) }
+    result.tickets = { strings[idx]: int( by_ticket[idx] ) for idx in numpy.flatnonzero( seen_tickets ) }
+    return result
+
+
+
+
+class SummaryCache( object ):
+    """Aggregates of closed days and weeks, kept in ~/.worklog/summaries
+
+    Day summaries are recorded as days are saved, and by summarize() for days
+    that weren't, which also rolls up weeks whose days are all closed, keyed by
+    their Monday. Days are stored in a file per month, weeks in a file per year.
+    Each summary holds the stamps of the days it was made from and is only used
+    while those days, and no others, still have those stamps, and while the
+    rollup exclusions are the ones it was made with. Open days are never
+    summarized, their last task runs on with the clock until the day is over.
+    A read only cache never writes its files."""
+
+    VERSION = 3
+    # length of the prefix of a key naming the file it's kept in
+    PERIODS = { 'days': 7, 'weeks': 4 }
+
+    def __init__( self, read_only = False ):
+        self.read_only = read_only
+        self.exclusions = sorted( rollup_exclusions() )
+        self.files = dict()
+        self.changed = set()
+
+    def path( self, name ):
+        return storage_path( 'summaries', '{}.json'.format( name ) )
+
+    def summaries( self, kind, key ):
+        """The summaries of kind kept in the same file as the YYYY-MM-DD key, by key
+
+        Each is [ { day: stamp }, { day: seconds }, descriptions, seconds,
+        tickets, seconds ], keys and values in separate lists as a ticket can
+        be None and flat lists load the fastest."""
+        name = '{}-{}'.format( kind, key[:self.PERIODS[kind]] )
+        summaries = self.files.get( name )
+        if summaries is None:
+            summaries = self.files[name] = dict()
+            # a damaged file is simply summarized again
+            data = load_state( self.path( name ), self.VERSION )
+            if data is not None and data.get( 'exclusions' ) == self.exclusions:
+                summaries.update( data['summaries'] )
+        return summaries
+
+    def get( self, kind, key, stamps ):
+        """Aggregate summarized as kind under the YYYY-MM-DD key, if made from days with stamps, a { day: stamp } dict, else None"""
+        summary = self.summaries( kind, key ).get( key )
+        if summary is None or summary[0] != stamps:
+            return None
+        result = Aggregate()
+        result.days = dict( summary[1] )
+        result.total = sum( result.days.values() )
+        result.descriptions = dict( zip( summary[2], summary[3] ) )
+        result.tickets = dict( zip( summary[4], summary[5] ) )
+        return result
+
+    def put( self, kind, key, stamps, result ):
+        self.summaries( kind, key )[key] = [ stamps, result.days,
+            list( result.descriptions ), list( result.descriptions.values() ),
+            list( result.tickets ), list( result.tickets.values() ) ]
+        self.changed.add( ( kind, key ) )
+
+    def discard( self, day ):
+        if self.summaries( 'days', day ).pop( day, None ) is not None:
+            self.changed.add( ( 'days', day ) )
+
+    def record( self, worklog ):
+        """Summarize worklog, just saved, if it's closed"""
+        day = worklog.when.strftime( '%F' )
+        table = StringTable()
+        columns = DayColumns.from_worklog( worklog, table, worklog.stamp )
+        current = to_epoch( now() )
+        if columns.closed( current ):
+            self.put( 'days', day, { day: columns.stamp }, aggregate( [ ( day, columns ) ], table.strings, current ) )
+        else:
+            self.discard( day )
+        self.save()
+
+    def save( self ):
+        if self.read_only:
+            return
+        for name in set( '{}-{}'.format( kind, key[:self.PERIODS[kind]] ) for kind, key in self.changed ):
+            save_state( self.path( name ), self.VERSION, { 'exclusions': self.exclusions, 'summaries': self.files[name] } )
+        self.changed.clear()
+
+
+def summarize( stamps, summaries, load, current = None ):
+    """Aggregate of the days of stamps, ( YYYY-MM-DD, stamp ) pairs in order, taking what it can from summaries
+
+    A week whose days all still have the stamps of its rollup is taken whole,
+    a day that still has the stamp of its summary likewise. load is only called
+    for the other days, with a list of them, and returns ( ( day, DayColumns )
+    pairs, strings ) for them. Closed days among them are summarized one by one
+    and added to summaries, open days are aggregated together like aggregate()
+    does. Weeks that turn out to be all closed are rolled up again, then
+    summaries are saved."""
+    with traced( 'summarize' ):
+        if current is None:
+            current = to_epoch( now() )
+        result = Aggregate()
+        weeks = dict()
+        for day, stamp in stamps:
+            when = date.fromisoformat( day )
+            monday = ( when - timedelta( days = when.weekday() ) ).isoformat()
+            weeks.setdefault( monday, dict() )[day] = stamp
+
+        # ( stamp, Aggregate ) of each closed day of the weeks to roll up again
+        closed = dict()
+        missing = list()
+        for monday in list( weeks ):
+            summary = summaries.get( 'weeks', monday, weeks[monday] )
+            if summary is not None:
+                result.merge( summary )
+                del weeks[monday]
+                continue
+            for day, stamp in weeks[monday].items():
+                summary = summaries.get( 'days', day, { day: stamp } )
+                if summary is None:
+                    missing.append( day )
+                else:
+                    closed[day] = ( stamp, summary )
+                    result.merge( summary )
+
+        if missing:
+            days, strings = load( missing )
+            eligible = [ value is not None and include_in_rollup( value ) for value in strings ]
+            rest = list()
+            for day, columns in days:
+                if columns.closed( current ):
+                    summary = aggregate_python( [ ( day, columns ) ], strings, current, eligible, False )
+                    summaries.put( 'days', day, { day: columns.stamp }, summary )
+                    closed[day] = ( columns.stamp, summary )
+                    result.merge( summary )
+                else:
+                    rest.append( ( day, columns ) )
+            if rest:
+                result.merge( aggregate( rest, strings, current ) )
+
+        for monday, week in weeks.items():
+            if not all( day in closed for day in week ): continue
+            rollup = Aggregate()
+            for day in week:
+                rollup.merge( closed[day][1] )
+            summaries.put( 'weeks', monday, { day: closed[day][0] for day in week }, rollup )
+        summaries.save()
+        return result
+
+
+
 
 def parse_common_args( args ):
+    if worklog_cache is not None:
+        return worklog_cache.get( args.day )
     return Worklog( when = args.day )
 
 
+def load_summaries():
+    """The SummaryCache, the daemon's own when running in it"""
+    return worklog_cache.summaries if worklog_cache is not None else SummaryCache()
+
+
+def load_history_index( rebuild = False ):
+    """An up to date HistoryIndex, the daemon's own when running in it"""
+    index = worklog_cache.index if worklog_cache is not None else HistoryIndex()
+    if rebuild:
+        index.rebuild()
+    else:
+        index.refresh()
+    return index
+
+
 def on_start( args ):
     worklog = parse_common_args( args )
 
@@ -446,43 +2040,170 @@ def on_start( args ):
     report( worklog )
 
 
-def on_resume( args ):
-    worklog = parse_common_args( args )
+RESUME_DAYS = 14
 
-    start = resolve_at_or_ago( args, date = worklog.when )
+class ResumeCandidates( object ):
+    """Descriptions worked on day by day, cached in ~/.worklog/resume.json
 
-    try:
-        descriptions = list()
-        for description in reversed( [ task.description for task in worklog if isinstance( task, Task ) ] ):
-            if description not in descriptions:
-                descriptions.append( description )
+    For every day, each description is stored with its latest ticket, how many
+    times it was started and when it was last started, along with the stamp of
+    the day it was made from. Like HistoryIndex, refresh() only loads the days
+    whose stamp changed, so saving a day never has to touch the file."""
 
-        # when using resume, it means we're no longer working on the description that is now the first
-        # item in this list, because of how we've sorted it. It is quite inconvenient for the first
-        # choice to be the one we know for sure the user won't pick, bump it to the end of the line
-        most_recent_description = descriptions.pop( 0 )
-        descriptions.append( most_recent_description )
+    VERSION = 2
 
-        for idx, description in enumerate( descriptions ):
-            sys.stdout.write( '[{:d}] {}\n'.format( idx, description ) )
+    def __init__( self, path = None, today = None ):
+        self.path = path or storage_path( 'resume.json' )
+        self.today = today or date.today()
+        data = load_state( self.path, self.VERSION )
+        self.days = data['days'] if data is not None else dict()
+        self.dirty = data is None
 
-        description = None
+    @staticmethod
+    def summarize( worklog ):
+        """[ description, ticket, count, last start ] of each description in worklog"""
+        entries = dict()
+        for task in worklog:
+            if not isinstance( task, Task ): continue
+            entry = entries.get( task.description )
+            if entry is None:
+                entry = entries[task.description] = [ task.description, None, 0, 0 ]
+            entry[1] = task.ticket
+            entry[2] += 1
+            entry[3] = to_epoch( task.start )
+        return list( entries.values() )
+
+    def refresh( self, first, last ):
+        """Bring the days from first to last up to date with the day files, saving the file if anything changed
+
+        Only the stamps of those days are taken, never the whole history. Days
+        outside that span are dropped unless they are among the last
+        RESUME_DAYS before today, so the file stays small."""
+        recent = ( self.today - timedelta( days = RESUME_DAYS ) ).strftime( '%F' )
+        for day in list( self.days ):
+            if not ( first.strftime( '%F' ) <= day <= last.strftime( '%F' ) or day > recent ):
+                del self.days[day]
+                self.dirty = True
+
+        when = first
+        while when <= last:
+            day = when.strftime( '%F' )
+            stamp = day_stamp( when )
+            cached = self.days.get( day )
+            if not stamp:
+                if cached is not None:
+                    del self.days[day]
+                    self.dirty = True
+            elif cached is None or cached[0] != stamp:
+                self.days[day] = [ stamp, self.summarize( Worklog( when = when ) ) ]
+                self.dirty = True
+            when += timedelta( days = 1 )
+
+        if self.dirty:
+            self.save()
 
-        while description is None:
-            try:
-                idx = int( input( 'Which description: ' ) )
-                description = descriptions[idx]
-                for task in worklog:
-                    if task.description == description:
-                        ticket = task.ticket
-            except KeyboardInterrupt:
-                raise Abort()
-            except EOFError:
-                raise Abort()
-            except ValueError:
-                sys.stdout.write( 'Must be an integer between 0 and {:d}\n'.format( len( descriptions ) ) )
-            except IndexError:
-                sys.stdout.write( 'Must be an integer between 0 and {:d}\n'.format( len( descriptions ) ) )
+    def save( self ):
+        save_state( self.path, self.VERSION, { 'days': self.days } )
+        self.dirty = False
+
+    def ranked( self, days = RESUME_DAYS, current = None ):
+        """( description, ticket ) pairs, best first
+
+        Each start of a description counts for less the older its day is, so
+        what was worked on often and lately comes first. Ages are counted back
+        from current, a Worklog, or from today without one; the entries of
+        current are taken from it rather than from the file, and always count."""
+        days = min( max( days, 1 ), RESUME_DAYS )
+        reference = current.when if current is not None else self.today
+        first = reference - timedelta( days = days - 1 )
+        self.refresh( first, reference )
+
+        found = dict( ( day, cached[1] ) for day, cached in self.days.items() )
+        if current is not None:
+            found[reference.strftime( '%F' )] = self.summarize( current )
+
+        scores = dict()
+        for day, entries in found.items():
+            age = ( reference - parse_date( day ) ).days
+            if age < 0 or age >= days: continue
+            weight = 1.0 / ( 1 + age )
+            for description, ticket, count, last in entries:
+                score = scores.get( description )
+                if score is None:
+                    score = scores[description] = [ 0.0, 0, None ]
+                score[0] += count * weight
+                if last >= score[1]:
+                    score[1], score[2] = last, ticket
+
+        ordered = sorted( scores.items(), key = lambda item: ( item[1][0], item[1][1] ), reverse = True )
+        return [ ( description, score[2] ) for description, score in ordered ]
+
+
+def pick_candidate( candidates, text ):
+    """The best ranked candidate whose description contains text, or failing that the closest match"""
+    lowered = text.lower()
+    for candidate in candidates:
+        if lowered in candidate[0].lower():
+            return candidate
+
+    import difflib
+    descriptions = [ candidate[0] for candidate in candidates ]
+    matches = difflib.get_close_matches( text, descriptions, n = 1, cutoff = 0.5 )
+    if matches:
+        return candidates[descriptions.index( matches[0] )]
+    return None
+
+
+def on_resume( args ):
+    worklog = parse_common_args( args )
+
+    start = resolve_at_or_ago( args, date = worklog.when )
+
+    try:
+        candidates = ResumeCandidates().ranked( days = args.days, current = worklog )
+
+        # when using resume, it means we're no longer working on the most recent task of the day.
+        # It is quite inconvenient for the first choice to be the one we know for sure the user
+        # won't pick, bump it to the end of the line
+        for task in reversed( worklog ):
+            if isinstance( task, Task ):
+                for idx, candidate in enumerate( candidates ):
+                    if candidate[0] == task.description:
+                        candidates.append( candidates.pop( idx ) )
+                        break
+                break
+
+        if not candidates:
+            sys.stderr.write( 'Nothing to resume from the last {:d} days\n'.format( args.days ) )
+            raise SystemExit( 1 )
+
+        if args.pick is not None:
+            candidate = pick_candidate( candidates, args.pick )
+            if candidate is None:
+                sys.stderr.write( 'No task matching "{}" in the last {:d} days\n'.format( args.pick, args.days ) )
+                raise SystemExit( 1 )
+            description, ticket = candidate
+        else:
+            for idx, ( description, ticket ) in enumerate( candidates ):
+                if ticket:
+                    sys.stdout.write( '[{:d}] {} {}\n'.format( idx, description, Color.faint( ticket ) ) )
+                else:
+                    sys.stdout.write( '[{:d}] {}\n'.format( idx, description ) )
+
+            description = None
+
+            while description is None:
+                try:
+                    idx = int( input( 'Which description: ' ) )
+                    description, ticket = candidates[idx]
+                except KeyboardInterrupt:
+                    raise Abort()
+                except EOFError:
+                    raise Abort()
+                except ValueError:
+                    sys.stdout.write( 'Must be an integer between 0 and {:d}\n'.format( len( candidates ) - 1 ) )
+                except IndexError:
+                    sys.stdout.write( 'Must be an integer between 0 and {:d}\n'.format( len( candidates ) - 1 ) )
 
         worklog.insert( Task( start = start, ticket = ticket, description = description ) )
         worklog.save()
@@ -499,127 +2220,1684 @@ def on_stop( args ):
     worklog.save()
     report( worklog )
 
+    # uploading is left to a worker in the background, stop never waits on Jira
+    if load_config().get( 'upload_on_stop' ) and UploadSpool().put( worklog, UploadLedger() ):
+        start_upload_worker()
+
+
+JIRA_TIMEZONE = timezone( timedelta( hours = -4 ) )
+UPLOAD_WORKERS = 4
+UPLOAD_ATTEMPTS = 4
+UPLOAD_BACKOFF = 0.5
+UPLOAD_RATE = 10
+UPLOAD_BATCH = 32
+UPLOAD_TIMEOUT = 30
+UPLOAD_SPOOL = 'spool'
+UPLOAD_LOG = 'upload.log'
+UPLOAD_RETRY = 30
+UPLOAD_RETRY_MAX = 60 * 60
+
+JIRA_SESSION = 'jira-session.json'
+JIRA_SESSION_LIFETIME = 8 * 60 * 60
+
+class LoginRequired( Exception ):
+    """Jira needs a detail only the user can give, and asking them isn't allowed"""
+
+
+class JiraConnector( object ):
+    """Makes Jira clients, resuming the session of an earlier upload while it lasts
+
+    After an upload, the cookies of the session are kept in
+    ~/.worklog/jira-session.json, readable by the user alone, for
+    JIRA_SESSION_LIFETIME seconds, or the "session_lifetime" from the config
+    file. A client resuming it needs no password, so nothing is prompted for.
+    Clients never ask the server for its version first, upload doesn't need it.
+    Unless interactive, nothing is prompted for, and connect() raises
+    LoginRequired instead."""
+
+    VERSION = 1
+
+    def __init__( self, path = None, interactive = True ):
+        self.path = path or storage_path( JIRA_SESSION )
+        self.interactive = interactive
+        self.config = load_config()
+        self.server = None
+        self.username = None
+        self.resumed = False
+
+    def saved_session( self ):
+        """The saved session if it hasn't expired, None otherwise"""
+        session = load_state( self.path, self.VERSION )
+        if session is None or session.get( 'expires', 0 ) <= to_epoch( datetime.now() ):
+            return None
+        return session
+
+    def connect( self, resume = True ):
+        from jira.client import JIRA
+
+        session = self.saved_session() if resume else None
+        self.server = self.config.get( 'server' ) or ( session or dict() ).get( 'server' ) or self.ask( 'Jira Server' )
+        self.username = self.config.get( 'username' ) or ( session or dict() ).get( 'username' ) or self.ask( 'Jira Username' )
+        options = { 'server': self.server }
+
+        self.resumed = session is not None and session.get( 'server' ) == self.server and session.get( 'username' ) == self.username
+        with traced( 'jira connect' ):
+            # JiraUploader and the spool do the retrying, the client's own would wait minutes on an unreachable server
+            if self.resumed:
+                options['cookies'] = session['cookies']
+                return JIRA( options = options, get_server_info = False, max_retries = 0, timeout = UPLOAD_TIMEOUT )
+
+            password = self.config.get( 'password' )
+            if password is None:
+                from getpass import getpass
+                password = getpass() if self.interactive else self.ask( 'Password' )
+            return JIRA( options = options, basic_auth = ( self.username, password ), get_server_info = False, max_retries = 0, timeout = UPLOAD_TIMEOUT )
+
+    def ask( self, what ):
+        if not self.interactive:
+            raise LoginRequired( 'no {} saved'.format( what.lower() ) )
+        return input( '\n{}: '.format( what ) )
+
+    def save( self, jira ):
+        """Keep the session of jira for the next upload, when the server gave it one"""
+        cookies = dict( getattr( getattr( jira, '_session', None ), 'cookies', None ) or dict() )
+        if not cookies:
+            return
+        session = {
+            'server': self.server,
+            'username': self.username,
+            'cookies': cookies,
+            'expires': to_epoch( datetime.now() ) + self.config.get( 'session_lifetime', JIRA_SESSION_LIFETIME ),
+        }
+        save_state( self.path, self.VERSION, session, mode = 0o600 )
+
+    def forget( self ):
+        try:
+            os.unlink( self.path )
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+
 
-def log_to_jira( worklog ):
-    config_path = os.path.expanduser( '~/.worklog/config.json' )
+def upload_entries( worklog ):
+    """( task, duration, started ) for every interval of the worklog that should be logged to a ticket"""
+    if len( worklog ) == 0: return
 
-    try:
-        with open( config_path ) as json_data:
-            auth_file = json.load( json_data )
-    except OSError as e:
-        if e.errno ==  errno.ENOENT:
-            server = imput( '\nJira Server: ' )
-            options = { 'server': server }
-            username = input( '\nJira Username: ' )
-            password = getpass()
-        else:
-            raise e
-    else:
+    for task, next_task in worklog.pairwise():
+        if isinstance( task, GoHome ): continue
+        if task.ticket is None: continue
+
+        duration = Duration( delta = next_task.start - task.start )
+        # Jira rejects worklogs without any time spent
+        if not str( duration ): continue
+
+        started = task.start.replace( second = 0, microsecond = 0, tzinfo = JIRA_TIMEZONE )
+        yield task, duration, started
+
+
+
+class TokenBucket( object ):
+    """Thread safe rate limiter, allows rate calls per second on average in bursts of up to burst calls"""
+
+    def __init__( self, rate, burst = None ):
+        import threading
+
+        self.rate = float( rate )
+        self.capacity = float( burst or max( rate, 1 ) )
+        self.tokens = self.capacity
+        self.updated = perf_counter()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire( self ):
+        """Block until a call is allowed"""
+        while True:
+            with self.lock:
+                current = perf_counter()
+                self.tokens = min( self.capacity, self.tokens + ( current - self.updated ) * self.rate )
+                self.updated = current
+                wait = self.paused_until - current
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = ( 1 - self.tokens ) / self.rate
+            sleep( wait )
+
+    def pause( self, seconds ):
+        """Allow no calls at all for the next seconds"""
+        with self.lock:
+            self.paused_until = max( self.paused_until, perf_counter() + seconds )
+            self.tokens = 0
+
+
+
+class UploadLedger( object ):
+    """Record of the worklogs already posted to Jira, kept in ~/.worklog/uploads.json
+
+    For each day, maps the start time and ticket of every uploaded interval to
+    the time logged for it and the id of the Jira worklog holding it."""
+
+    VERSION = 1
+
+    def __init__( self, path = None ):
+        self.path = path or storage_path( 'uploads.json' )
+        # forgetting what was posted would post it all again, a damaged ledger has to be looked at
+        data = load_state( self.path, self.VERSION, strict = True )
+        self.days = data['days'] if data is not None else dict()
+
+    @staticmethod
+    def key( task ):
+        return '{} {}'.format( task.start.strftime( '%H:%M:%S' ), task.ticket )
+
+    def change( self, day, key, duration ):
+        """( 'post', None ) if Jira doesn't hold the interval of key yet, ( 'update', record ) if it holds another time, ( None, record ) if it's up to date"""
+        record = self.days.get( day, dict() ).get( key )
+        if record is None:
+            return 'post', None
+        if record['time'] != str( duration ):
+            return 'update', record
+        return None, record
+
+    def plan( self, day, entries ):
+        """Split a day's entries into ( to post, ( entry, record ) to update, ( key, record ) of worklogs to delete )"""
+        keys = set()
+        post = list()
+        update = list()
+        for entry in entries:
+            key = self.key( entry[0] )
+            keys.add( key )
+            action, record = self.change( day, key, entry[1] )
+            if action == 'post':
+                post.append( entry )
+            elif action == 'update':
+                update.append( ( entry, record ) )
+        delete = [ ( key, record ) for key, record in self.days.get( day, dict() ).items() if key not in keys ]
+        return post, update, delete
+
+    def record( self, day, task, duration, worklog_id ):
+        self.days.setdefault( day, dict() )[self.key( task )] = {
+            'ticket': task.ticket,
+            'time': str( duration ),
+            'id': worklog_id,
+        }
+
+    def forget( self, day, key ):
+        recorded = self.days.get( day, dict() )
+        recorded.pop( key, None )
+        if not recorded:
+            self.days.pop( day, None )
+
+    def save( self ):
+        save_state( self.path, self.VERSION, { 'days': self.days } )
+
+
+
+class UploadSpool( object ):
+    """Worklog intervals waiting to be sent to Jira, kept in ~/.worklog/spool, a file per day
+
+    A day's file maps the ledger key of each interval Jira doesn't hold yet to
+    what Jira should end up with for it: its ticket, start and length, or that
+    whatever was logged for it is to be removed. Files are written atomically
+    under the spool's lock, and an entry is taken out only once the ledger has
+    been saved with what Jira answered, so entries survive being offline and
+    being killed: one can be sent twice, but is never lost. Each entry sent is
+    acknowledged at once by a line appended to ~/.worklog/spool/sent.journal,
+    which settle() folds into the ledger after every batch or, after a crash,
+    on the next flush."""
+
+    VERSION = 1
+
+    def __init__( self ):
+        self.directory = storage_path( UPLOAD_SPOOL )
+        self.journal = os.path.join( self.directory, 'sent.journal' )
+        self.lock = FileLock( storage_path( 'locks', 'spool.lock' ) )
+
+    def path( self, day ):
+        return os.path.join( self.directory, '{}.json'.format( day ) )
+
+    def days( self ):
+        """The days with entries waiting, in order"""
         try:
-            options = { 'server': '{}'.format( auth_file['server'] ) }
-        except KeyError:
-            server = imput( '\nJira Server: ' )
-            options = { 'server': server }
+            files = os.listdir( self.directory )
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return list()
+        return sorted( name[:-len( '.json' )] for name in files if name.endswith( '.json' ) )
+
+    def read( self, day ):
+        """The entries waiting for day, by key"""
+        # entries are never dropped unsent, a damaged file has to be looked at
+        data = load_state( self.path( day ), self.VERSION, strict = True )
+        return data['entries'] if data is not None else dict()
+
+    def write( self, day, entries ):
+        if entries:
+            save_state( self.path( day ), self.VERSION, { 'entries': entries } )
+        elif os.path.exists( self.path( day ) ):
+            os.unlink( self.path( day ) )
+
+    def entries( self ):
+        """( day, key, entry ) of every entry waiting, in order"""
+        return [ ( day, key, entry ) for day in self.days() for key, entry in sorted( self.read( day ).items() ) ]
+
+    def put( self, worklog, ledger ):
+        """Spool whatever Jira needs to hold exactly the intervals of worklog, going by ledger, returns how many entries that takes
+
+        Whatever was spooled for the day before is replaced."""
+        day = worklog.when.strftime( '%F' )
+        post, update, delete = ledger.plan( day, upload_entries( worklog ) )
+        entries = dict()
+        for task, duration, started in post + [ entry for entry, record in update ]:
+            entries[ledger.key( task )] = {
+                'ticket': task.ticket,
+                'description': task.description,
+                'start': task.start.strftime( '%Y-%m-%dT%H:%M:%S' ),
+                'seconds': int( duration.delta.total_seconds() ),
+            }
+        for key, record in delete:
+            entries[key] = { 'ticket': record['ticket'], 'remove': True }
 
+        with self.lock:
+            if self.read( day ) != entries:
+                self.write( day, entries )
+        return len( entries )
+
+    def acknowledge( self, day, key, entry, record ):
+        """Note that Jira holds what entry asked for, record being the ledger's record of it, None once removed
+
+        A single append, safe from several threads at once; it isn't synced,
+        an acknowledgement lost with the machine only has its entry sent again."""
+        line = json.dumps( { 'day': day, 'key': key, 'entry': entry, 'record': record } ) + '\n'
+        fd = os.open( self.journal, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644 )
         try:
-            username = auth_file['username']
-        except KeyError:
-            username = input( '\nJira Username: ' )
+            trace_count( 'file writes' )
+            os.write( fd, line.encode( 'utf-8' ) )
+        finally:
+            os.close( fd )
 
+    def settle( self, ledger ):
+        """Fold the acknowledgements into ledger and save it, then take their entries out, unless spooled again since"""
         try:
-            password = auth_file['password']
-        except KeyError:
-            password = getpass()
+            with open( self.journal, 'r' ) as journal_file:
+                trace_count( 'file reads' )
+                lines = journal_file.read().splitlines()
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return
 
-    auth = ( username, password )
-    jira = JIRA( options, basic_auth = auth )
-    if len( worklog ) != 0:
-        for task, next_task in worklog.pairwise():
-            if isinstance( task, GoHome ): continue
+        acknowledged = list()
+        for line in lines:
+            try:
+                acknowledged.append( json.loads( line ) )
+            except ValueError:
+                # cut short by a crash, its entry is simply sent again
+                continue
+        for sent in acknowledged:
+            if sent['record'] is None:
+                ledger.forget( sent['day'], sent['key'] )
+            else:
+                ledger.days.setdefault( sent['day'], dict() )[sent['key']] = sent['record']
+        ledger.save()
+
+        with self.lock:
+            for day in sorted( set( sent['day'] for sent in acknowledged ) ):
+                entries = self.read( day )
+                for sent in acknowledged:
+                    if sent['day'] == day and entries.get( sent['key'] ) == sent['entry']:
+                        del entries[sent['key']]
+                self.write( day, entries )
+            os.unlink( self.journal )
+
+    def send( self, uploader, entries ):
+        """Have uploader, which must have a ledger, carry out entries, ( day, key, entry ) triples
+
+        Returns ( action, error ) for each that failed. Entries the ledger
+        says Jira already holds are acknowledged without a call, the others as
+        soon as their call succeeds: the ledger may have moved on since they
+        were spooled, so it is asked again what each takes."""
+        ledger = uploader.ledger
+        sending = dict()
+        posts, updates, deletes = list(), list(), list()
+        for day, key, entry in entries:
+            sending[day, key] = entry
+
+            if entry.get( 'remove' ):
+                record = ledger.days.get( day, dict() ).get( key )
+                if record is None:
+                    self.acknowledge( day, key, entry, None )
+                else:
+                    deletes.append( ( day, key, record ) )
+                continue
+
+            task = Task( start = datetime.strptime( entry['start'], '%Y-%m-%dT%H:%M:%S' ), ticket = entry['ticket'], description = entry['description'] )
+            duration = Duration( delta = timedelta( seconds = entry['seconds'] ) )
+            started = task.start.replace( second = 0, microsecond = 0, tzinfo = JIRA_TIMEZONE )
+            action, record = ledger.change( day, key, duration )
+            if action == 'post':
+                posts.append( ( day, ( task, duration, started ) ) )
+            elif action == 'update':
+                updates.append( ( day, ( task, duration, started ), record ) )
+            else:
+                self.acknowledge( day, key, entry, record )
+
+        def done( day, key ):
+            self.acknowledge( day, key, sending[day, key], ledger.days.get( day, dict() ).get( key ) )
+
+        return uploader.run( posts, updates, deletes, done = done )
+
+
+
+def transport_errors():
+    """Exceptions raised when Jira could not be reached or took too long, whatever the request was"""
+    try:
+        from requests import ConnectionError as RequestsConnectionError, Timeout
+    except ImportError:
+        return ( ConnectionError, TimeoutError )
+    return ( ConnectionError, TimeoutError, RequestsConnectionError, Timeout )
+
+
+class JiraUploader( object ):
+    """Posts worklog entries to Jira over a bounded pool of threads sharing one client
+
+    Each distinct ticket is looked up once, and the posts for a ticket start as
+    soon as its lookup finishes. Calls failing with a connection error, a
+    throttling response or a server error are retried with exponential
+    backoff, and a limiter, if given, paces every call and is paused when the
+    server responds with Retry-After. The latency of every call is recorded for
+    summary()."""
+
+    def __init__( self, jira, workers = UPLOAD_WORKERS, attempts = UPLOAD_ATTEMPTS, backoff = UPLOAD_BACKOFF, ledger = None, limiter = None ):
+        import threading
+        try:
+            from jira.exceptions import JIRAError
+            from requests import RequestException
+        except ImportError:
+            # only a stand-in client, like the benchmark's, works without them, and it raises neither
+            self.transient = ()
+        else:
+            self.transient = ( JIRAError, RequestException )
+
+        self.jira = jira
+        self.workers = workers
+        self.attempts = attempts
+        self.backoff = backoff
+        self.ledger = ledger
+        self.limiter = limiter
+        self.latencies = dict()
+        self.retries = 0
+        self.bytes = 0
+        self.completed = 0
+        self.elapsed = 0.0
+        self.lock = threading.Lock()
+
+        # one connection per worker, instead of requests' default pool of 10 dropping the surplus
+        session = getattr( jira, '_session', None )
+        if session is not None:
+            from requests.adapters import HTTPAdapter
+            adapter = HTTPAdapter( pool_connections = 1, pool_maxsize = workers )
+            session.mount( 'https://', adapter )
+            session.mount( 'http://', adapter )
+            session.hooks['response'].append( self.count_bytes )
+
+    @staticmethod
+    def retryable( err ):
+        """Whether err is one that may pass, a connection error, a timeout, throttling or a server error"""
+        status = getattr( err, 'status_code', None )
+        if status is None:
+            status = getattr( getattr( err, 'response', None ), 'status_code', None )
+        if status is None:
+            return isinstance( err, transport_errors() )
+        return status == 429 or status >= 500
+
+    def retry_after( self, err ):
+        """Seconds the server asked us to wait before trying again, None if it didn't say"""
+        headers = getattr( getattr( err, 'response', None ), 'headers', None ) or dict()
+        try:
+            return float( headers.get( 'Retry-After' ) )
+        except ( TypeError, ValueError ):
+            return None
+
+    def count_bytes( self, response, *args, **kwargs ):
+        sent = response.request.body or b''
+        with self.lock:
+            self.bytes += len( sent ) + len( response.content )
+        trace_count( 'network calls' )
+        trace_count( 'network bytes', len( sent ) + len( response.content ) )
+
+    def call( self, kind, function, *args, **kwargs ):
+        delay = self.backoff
+        for attempt in range( 1, self.attempts + 1 ):
+            if self.limiter is not None:
+                self.limiter.acquire()
+            began = perf_counter()
+            try:
+                with traced( 'jira {}'.format( kind ) ):
+                    return function( *args, **kwargs )
+            except self.transient as err:
+                if attempt == self.attempts or not self.retryable( err ):
+                    raise
+                with self.lock:
+                    self.retries += 1
+                wait = self.retry_after( err )
+            finally:
+                with self.lock:
+                    self.latencies.setdefault( kind, list() ).append( perf_counter() - began )
+
+            if wait is None:
+                sleep( delay )
+                delay *= 2
+            elif self.limiter is not None:
+                # throttling applies to the whole client, so hold back every worker, not just this one
+                self.limiter.pause( wait )
+            else:
+                sleep( wait )
+
+    def post( self, day, issue, task, duration, started ):
+        issue = issue.result()
+        worklog = self.call( 'add_worklog', self.jira.add_worklog, issue = issue, timeSpent = str( duration ), started = started )
+        with self.lock:
+            if self.ledger is not None:
+                self.ledger.record( day, task, duration, worklog.id )
+            sys.stdout.write( 'Logging {} to ticket {}\n'.format( duration, issue ) )
+
+    def update( self, day, record, task, duration, started ):
+        worklog = self.call( 'worklog', self.jira.worklog, task.ticket, record['id'] )
+        self.call( 'update', worklog.update, timeSpent = str( duration ), started = started.strftime( '%Y-%m-%dT%H:%M:%S.000%z' ) )
+        with self.lock:
+            self.ledger.record( day, task, duration, record['id'] )
+            sys.stdout.write( 'Updating {} to {} on ticket {}\n'.format( record['time'], duration, task.ticket ) )
+
+    def delete( self, day, key, record ):
+        try:
+            worklog = self.call( 'worklog', self.jira.worklog, record['ticket'], record['id'] )
+            self.call( 'delete', worklog.delete )
+        except self.transient as err:
+            # already gone from the server, which is all we wanted
+            if getattr( err, 'status_code', None ) != 404:
+                raise
+        with self.lock:
+            self.ledger.forget( day, key )
+            sys.stdout.write( 'Removing {} from ticket {}\n'.format( record['time'], record['ticket'] ) )
+
+    def run( self, posts, updates, deletes, done = None ):
+        """Carry out posts, ( day, entry ) pairs, updates, ( day, entry, record ), and deletes, ( day, key, record )
+
+        Returns ( action, error ) for each that failed with a Jira or a
+        connection error; any other error is raised once every action is done.
+        done, if given, is called with the day and ledger key of each that
+        succeeded, as soon as it has, from the thread that carried it out."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        def job( function, day, key, *args ):
+            function( day, *args )
+            if done is not None:
+                done( day, key )
+
+        jobs = list()
+        began = perf_counter()
+        try:
+            with ThreadPoolExecutor( max_workers = self.workers ) as pool:
+                # lookups are queued first, so a post waiting on its issue never starves the lookup it waits for
+                issues = dict()
+                for day, ( task, duration, started ) in posts:
+                    if task.ticket not in issues:
+                        issues[task.ticket] = pool.submit( self.call, 'issue', self.jira.issue, task.ticket )
+
+                for day, entry in posts:
+                    task, duration, started = entry
+                    action = 'log {} to ticket {}'.format( duration, task.ticket )
+                    jobs.append( ( action, pool.submit( job, self.post, day, UploadLedger.key( task ), issues[task.ticket], *entry ) ) )
+                for day, entry, record in updates:
+                    task, duration, started = entry
+                    action = 'update {} to {} on ticket {}'.format( record['time'], duration, task.ticket )
+                    jobs.append( ( action, pool.submit( job, self.update, day, UploadLedger.key( task ), record, *entry ) ) )
+                for day, key, record in deletes:
+                    action = 'remove {} from ticket {}'.format( record['time'], record['ticket'] )
+                    jobs.append( ( action, pool.submit( job, self.delete, day, key, key, record ) ) )
+
+                failures = list()
+                unexpected = None
+                for action, future in jobs:
+                    try:
+                        future.result()
+                    except self.transient as err:
+                        failures.append( ( action, err ) )
+                    except Exception as err:
+                        # a bug, not Jira failing, it must not be retried as if it may pass
+                        unexpected = unexpected or err
+                    else:
+                        self.completed += 1
+        finally:
+            self.elapsed += perf_counter() - began
+        if unexpected is not None:
+            raise unexpected
+        return failures
+
+    def summary( self ):
+        for kind in sorted( self.latencies ):
+            latencies = sorted( self.latencies[kind] )
+            sys.stdout.write( '{:>12s}: {:d} calls, {:.0f}ms median, {:.0f}ms max\n'.format(
+                kind,
+                len( latencies ),
+                latencies[len( latencies ) // 2] * 1000,
+                latencies[-1] * 1000
+            ) )
+        if self.elapsed > 0:
+            sys.stdout.write( '{:>12s}: {:d} entries in {:.1f}s, {:.1f} entries/sec, {:d} bytes, {:d} retries\n'.format(
+                'throughput',
+                self.completed,
+                self.elapsed,
+                self.completed / self.elapsed,
+                self.bytes,
+                self.retries
+            ) )
 
-            if task.ticket is not None:
-                time = Duration( delta = next_task.start - task.start )
-                started = '{}-{}-{}T{}:{}:00.000-0400'.format(
-                    task.start.year,
-                    task.start.month,
-                    task.start.day,
-                    task.start.hour,
-                    task.start.minute
-                )
-                ticket = jira.issue( task.ticket )
-                sys.stdout.write( '\nLogging {} to ticket {}\n'.format( time, ticket ) )
-                jira.add_worklog(
-                    issue = ticket,
-                    timeSpent = str( time ),
-                    started = datetime.strptime( started, '%Y-%m-%dT%H:%M:%S.000%z' )
-                )
+
+def log_to_jira( worklogs, workers = UPLOAD_WORKERS, rate = UPLOAD_RATE, connector = None ):
+    """Upload the intervals of every worklog over one connection, returns ( action, error ) for each call that failed
+
+    The intervals are spooled first, so whatever fails stays in the spool for
+    the next flush; see flush_spool()."""
+    spool = UploadSpool()
+    ledger = UploadLedger()
+    for worklog in worklogs:
+        spool.put( worklog, ledger )
+    return flush_spool( workers = workers, rate = rate, connector = connector )
+
+
+def flush_spool( workers = UPLOAD_WORKERS, rate = UPLOAD_RATE, connector = None, batch = UPLOAD_BATCH ):
+    """Send every spooled entry to Jira over one connection, returns ( action, error ) for each call that failed
+
+    Entries are sent batch at a time, and the ledger is saved after each
+    batch; after a batch of which nothing got through, for reasons that may
+    pass, the rest is left for later. Only one process flushes at once, the
+    others wait for it. When a resumed session turns out to have expired on
+    the server, it logs in again and retries; only what failed is still in
+    the spool."""
+    spool = UploadSpool()
+    with FileLock( storage_path( 'locks', 'upload.lock' ) ):
+        ledger = UploadLedger()
+        # acknowledgements left behind by a flush that was killed
+        spool.settle( ledger )
+        pending = spool.entries()
+        if not pending:
+            return list()
+
+        if connector is None:
+            connector = JiraConnector()
+        limiter = TokenBucket( rate ) if rate > 0 else None
+
+        resume = True
+        while True:
+            jira = connector.connect( resume = resume )
+            uploader = JiraUploader( jira, workers = workers, ledger = ledger, limiter = limiter )
+            failures = list()
+            for first in range( 0, len( pending ), batch ):
+                completed = uploader.completed
+                try:
+                    batch_failures = spool.send( uploader, pending[first:first + batch] )
+                finally:
+                    spool.settle( ledger )
+                failures.extend( batch_failures )
+                # nothing got through and it may pass, Jira is unreachable: the rest waits in the spool
+                if batch_failures and uploader.completed == completed and all( JiraUploader.retryable( err ) for action, err in batch_failures ):
+                    break
+            unauthorized = any( getattr( err, 'status_code', None ) == 401 for action, err in failures )
+            if not ( unauthorized and connector.resumed ):
+                break
+            connector.forget()
+            resume = False
+            pending = spool.entries()
+
+        if not unauthorized:
+            connector.save( jira )
+        uploader.summary()
+        return failures
+
+
+def drain_spool( workers = UPLOAD_WORKERS, rate = UPLOAD_RATE ):
+    """Flush the spool until nothing is left to retry, returns the failures of the last flush
+
+    After a flush that failed for a reason that may pass, like Jira being
+    unreachable, it waits UPLOAD_RETRY seconds, twice as long after each
+    further one up to UPLOAD_RETRY_MAX, and flushes again. Failures that won't
+    pass, like a ticket Jira doesn't know, stay in the spool for upload to
+    report. Nothing is prompted for, without a saved session or password it
+    gives up. Only one process drains at once, it returns at once if another is."""
+    try:
+        with FileLock( storage_path( 'locks', 'upload-worker.lock' ), blocking = False ):
+            delay = UPLOAD_RETRY
+            while True:
+                try:
+                    failures = flush_spool( workers = workers, rate = rate, connector = JiraConnector( interactive = False ) )
+                except LoginRequired as err:
+                    sys.stderr.write( 'cannot log in to Jira, {}, run worklog upload --flush\n'.format( err ) )
+                    return list()
+                if not any( JiraUploader.retryable( err ) for action, err in failures ):
+                    return failures
+                for action, err in failures:
+                    sys.stderr.write( '{} failed to {}: {}\n'.format( now().strftime( '%F %T' ), action, err ) )
+                sleep( delay )
+                delay = min( delay * 2, UPLOAD_RETRY_MAX )
+    except BlockingIOError:
+        return list()
+
+
+def start_upload_worker():
+    """Drain the spool in a process of its own in the background, logging to ~/.worklog/upload.log"""
+    import subprocess
+
+    command = [ sys.executable, os.path.abspath( __file__ ), '--root', WORKLOG_ROOT, 'upload', '--flush', '--retry' ]
+    with open( storage_path( UPLOAD_LOG ), 'ab' ) as log_file:
+        subprocess.Popen( command, stdin = subprocess.DEVNULL, stdout = log_file, stderr = subprocess.STDOUT, start_new_session = True )
 
 
 def report( worklog ):
-    total = timedelta( seconds = 0 )
-    rollup = dict()
+    with traced( 'render report' ):
+        day = worklog.when.strftime( '%F' )
+        table = StringTable()
+        result = aggregate( [ ( day, DayColumns.from_worklog( worklog, table ) ) ], table.strings, durations = True )
+
+        out = Renderer()
+        out.cell( out.title, 'Worklog Report for' )
+        out.write( ' ' )
+        out.cell( out.heading, day )
+        out.write( '\n' )
+
+        if len( worklog ) == 0:
+            out.write( '    no entries\n' )
+        else:
+            for ( task, next_task ), seconds in zip( worklog.pairwise(), result.durations[day] ):
+                if isinstance( task, GoHome ): continue
+
+                out.write( '    ' )
+                out.cell( out.time, task.start.strftime( '%H:%M' ) )
+                out.write( out.dash )
+                out.cell( out.open_time if isinstance( next_task, DummyRightNow ) else out.time, next_task.start.strftime( '%H:%M' ) )
+                out.write( out.paren, out.duration( seconds ), out.close, str( task.ticket ), '  ', task.description, '\n' )
+
+            out.write( '\n    ', out.duration( result.total, underline = True ), '  ', out.total, '\n' )
+            for key in sorted( result.descriptions.keys() ):
+                out.write( '    ', out.duration( result.descriptions[key] ), '  ' )
+                out.cell( out.label, key )
+                out.write( '\n' )
+
+        out.flush()
+
+
+def range_report( first, last ):
+    with traced( 'render range report' ):
+        found = scan_days()
+        span = first.strftime( '%F' ), last.strftime( '%F' )
+        stamps = [ ( day, found[day] ) for day in sorted( found ) if span[0] <= day <= span[1] ]
+
+        def load( days ):
+            storage = open_storage()
+            if isinstance( storage, SqliteStorage ):
+                # the database reads a range by its day index, the history index isn't needed
+                loaded, strings = storage.columns( min( days ), max( days ) )
+                wanted = set( days )
+                return [ ( day, columns ) for day, columns in loaded if day in wanted ], strings
+            # the index is only needed for days that aren't summarized
+            index = load_history_index()
+            return [ ( day, index.days[day] ) for day in days if day in index.days ], index.strings
+
+        result = summarize( stamps, load_summaries(), load )
+
+        out = Renderer()
+        out.cell( out.title, 'Worklog Report for' )
+        out.write( ' ' )
+        out.cell( out.heading, first.strftime( '%F' ) )
+        out.write( ' ' )
+        out.cell( out.title, 'through' )
+        out.write( ' ' )
+        out.cell( out.heading, last.strftime( '%F' ) )
+        out.write( '\n' )
+
+        if result.total == 0:
+            out.write( '    no entries\n' )
+            out.flush()
+            return
+
+        for day in sorted( result.days.keys() ):
+            out.write( '    ' )
+            out.cell( out.time, day )
+            out.write( '  ', out.duration( result.days[day] ), '\n' )
+
+        out.write( '\n    ', out.duration( result.total, underline = True ), '  ', out.total, '\n' )
+        for key in sorted( result.descriptions.keys() ):
+            out.write( '    ', out.duration( result.descriptions[key] ), '  ' )
+            out.cell( out.label, key )
+            out.write( '\n' )
+
+        tickets = sorted( key for key in result.tickets.keys() if key is not None )
+        if tickets:
+            out.write( '\n' )
+        for key in tickets:
+            out.write( '    ', out.duration( result.tickets[key] ), '  ' )
+            out.cell( out.ticket, key )
+            out.write( '\n' )
+
+        out.flush()
+
+
+def parse_range_args( args ):
+    """( first, last ) dates of a --from/--to range"""
+    first = parse_date( args.range_from )
+    last = parse_date( args.range_to ) if args.range_to else date.today()
+    return first, last
+
+
+WATCH_POLL_INTERVAL = 2.0
+
+class DirectoryWatcher( object ):
+    """Waits for files in a directory to change
+
+    Uses inotify, through ctypes, where the C library has it and polls every
+    WATCH_POLL_INTERVAL seconds otherwise. Either way, wait() only says that
+    something may have changed; callers compare file stamps to find out what."""
+
+    # IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE, snapshots are replaced by a rename
+    EVENTS = 0x002 | 0x008 | 0x080 | 0x100 | 0x200
+
+    def __init__( self, path ):
+        self.fd = None
+        try:
+            import ctypes
+            libc = ctypes.CDLL( None, use_errno = True )
+            fd = libc.inotify_init1( os.O_NONBLOCK | os.O_CLOEXEC )
+        except ( AttributeError, OSError ):
+            return
+        if fd < 0:
+            return
+        if libc.inotify_add_watch( fd, os.fsencode( path ), self.EVENTS ) < 0:
+            os.close( fd )
+            return
+        self.fd = fd
+
+    def wait( self, timeout ):
+        """Block for up to timeout seconds, less if a file changes"""
+        if self.fd is None:
+            sleep( min( timeout, WATCH_POLL_INTERVAL ) )
+            return
+
+        import select
+        readable, unused, unused = select.select( [ self.fd ], [], [], timeout )
+        if readable:
+            try:
+                while os.read( self.fd, 65536 ):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close( self ):
+        if self.fd is not None:
+            os.close( self.fd )
+            self.fd = None
+
+
+def watch_report( worklog, follow_today ):
+    """Keep the report of worklog on screen, redrawing it as it's saved and as the open task runs on
+
+    Only what was saved since the last redraw is read from disk, see
+    Worklog.refresh(). On a terminal, only the lines that changed are
+    rewritten; otherwise the whole report is written again after each change.
+    With follow_today, the report moves on to the next day at midnight."""
+    from contextlib import redirect_stdout
+    import io
+
+    directory = storage_path()
+    if not os.access( directory, os.F_OK ):
+        os.makedirs( directory, mode=0o755 )
+    watcher = DirectoryWatcher( directory )
+    terminal = sys.stdout.isatty()
+    shown = None
+    try:
+        while True:
+            if follow_today and worklog.when != date.today():
+                worklog = Worklog()
+            else:
+                worklog.refresh()
+
+            output = io.StringIO()
+            with redirect_stdout( output ):
+                report( worklog )
+            lines = output.getvalue().splitlines()
+
+            if lines != shown:
+                if not terminal:
+                    sys.stdout.write( '\n'.join( lines ) + '\n\n' )
+                elif shown is None:
+                    sys.stdout.write( '\033[H\033[2J' + '\n'.join( lines ) )
+                else:
+                    changes = list()
+                    for row, line in enumerate( lines ):
+                        if row >= len( shown ) or shown[row] != line:
+                            changes.append( '\033[{:d};1H{}\033[K'.format( row + 1, line ) )
+                    if len( lines ) < len( shown ):
+                        changes.append( '\033[{:d};1H\033[J'.format( len( lines ) + 1 ) )
+                    sys.stdout.write( ''.join( changes ) )
+                sys.stdout.flush()
+                shown = lines
+
+            # the open task's end moves with the clock, once a minute
+            watcher.wait( 60 - datetime.now().second )
+    except KeyboardInterrupt:
+        if terminal:
+            sys.stdout.write( '\n' )
+    finally:
+        watcher.close()
 
-    sys.stdout.write( '{} {}\n'.format(
-        Color.bold( 'Worklog Report for' ),
-        Color.purple( worklog.when.strftime( '%F' ), bold = True )
-    ) )
 
-    if len( worklog ) == 0:
-        sys.stdout.write( '    no entries\n' )
+def on_report( args ):
+    if args.range_from is not None:
+        first, last = parse_range_args( args )
+        range_report( first, last )
+    elif args.week:
+        when = parse_date( args.day ) if args.day else date.today()
+        first = when - timedelta( days = when.weekday() )
+        range_report( first, first + timedelta( days = 6 ) )
+    elif args.watch:
+        watch_report( parse_common_args( args ), follow_today = args.day is None )
+    else:
+        worklog = parse_common_args( args )
+        report( worklog )
+
+
+def on_search( args ):
+    if not args.terms and not args.ticket:
+        sys.stderr.write( 'search needs at least one TERM or --ticket\n' )
+        sys.exit( 2 )
+
+    first = parse_date( args.range_from ) if args.range_from else None
+    last = parse_date( args.range_to ) if args.range_to else None
+    storage = open_storage()
+    if args.ticket and not args.rebuild and isinstance( storage, SqliteStorage ):
+        # only the days using one of the tickets are read, found by the database's ticket index
+        days, strings = storage.columns( first and first.strftime( '%F' ), last and last.strftime( '%F' ), args.ticket )
+        index = HistoryIndex.from_days( days, strings )
     else:
+        index = load_history_index( rebuild = args.rebuild )
+
+    out = Renderer()
+    total = 0
+    count = 0
+    for day, start, end, ticket, description in index.search( args.terms, args.ticket or (), first, last ):
+        total += end - start
+        count += 1
+        out.write( '    ' )
+        out.cell( out.day, day )
+        out.write( ' ' )
+        out.cell( out.time, from_epoch( start ).strftime( '%H:%M' ) )
+        out.write( out.dash )
+        out.cell( out.time, from_epoch( end ).strftime( '%H:%M' ) )
+        out.write( out.paren, out.duration( end - start ), out.close, str( ticket ), '  ', description, '\n' )
+
+    if count == 0:
+        out.write( '    no matches\n' )
+    else:
+        out.write( '\n    ', out.duration( total, underline = True ), '  ' )
+        out.write( Color.colorize( '{:d} matches'.format( count ), bold = True, underline = True ), '\n' )
+    out.flush()
+
+
+def team_member( root ):
+    """Name of the user owning the worklog directory root, /srv/worklogs/jsmith/.worklog belongs to jsmith"""
+    head, name = os.path.split( os.path.normpath( root ) )
+    if name.startswith( '.' ) and head:
+        name = os.path.basename( head )
+    return name
+
+
+def team_worker( exclusions ):
+    """Runs first in every team-report process, so all users' time is counted by the same rules"""
+    global _rollup_exclusions
+    _rollup_exclusions = exclusions
+
+
+def team_aggregate( job ):
+    """Aggregate of the days first to last of the worklog directory root
+
+    Closed days are taken from the user's summaries, the others from their
+    index where it is up to date and parsed from their files otherwise; nothing
+    is written to the user's directory. Meant to run in a process of its own,
+    it points WORKLOG_ROOT at root."""
+    global WORKLOG_ROOT
+    root, first, last, current = job
+    WORKLOG_ROOT = root
+
+    found = scan_days()
+    stamps = [ ( day, found[day] ) for day in sorted( found ) if first <= day <= last ]
+
+    def load( days ):
+        index = HistoryIndex()
+        columns = list()
+        for day in days:
+            day_columns = index.days.get( day )
+            if day_columns is None or day_columns.stamp != found[day]:
+                day_columns = DayColumns.from_worklog( Worklog( when = day ), index.table, found[day] )
+            columns.append( ( day, day_columns ) )
+        return columns, index.strings
+
+    return summarize( stamps, SummaryCache( read_only = True ), load, current )
+
+
+def team_totals( roots, first, last, workers = None ):
+    """( seconds per user, seconds per ticket per user ) over the worklog directories roots
+
+    Users are loaded and aggregated by up to workers processes at once,
+    defaulting to one per cpu."""
+    global WORKLOG_ROOT
+    with traced( 'team aggregate' ):
+        current = to_epoch( now() )
+        jobs = [ ( root, first.strftime( '%F' ), last.strftime( '%F' ), current ) for root in roots ]
+        workers = min( workers or os.cpu_count() or 1, len( jobs ) )
+        if workers <= 1:
+            # the caller's exclusions, not those of whichever user is loaded first
+            saved = WORKLOG_ROOT, _rollup_exclusions
+            team_worker( rollup_exclusions() )
+            try:
+                results = [ team_aggregate( job ) for job in jobs ]
+            finally:
+                WORKLOG_ROOT, exclusions = saved
+                team_worker( exclusions )
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor( max_workers = workers, initializer = team_worker, initargs = ( rollup_exclusions(), ) ) as executor:
+                results = list( executor.map( team_aggregate, jobs ) )
+
+        names = [ team_member( root ) for root in roots ]
+        users = dict()
+        tickets = dict()
+        for root, name, result in zip( roots, names, results ):
+            # two directories of the same name are told apart by their full path
+            user = name if names.count( name ) == 1 else root
+            users[user] = users.get( user, 0 ) + result.total
+            for ticket, seconds in result.tickets.items():
+                if ticket is None: continue
+                per_user = tickets.setdefault( ticket, dict() )
+                per_user[user] = per_user.get( user, 0 ) + seconds
+        return users, tickets
+
+
+def team_report( roots, first, last, workers = None ):
+    users, tickets = team_totals( roots, first, last, workers )
+
+    with traced( 'render team report' ):
+        out = Renderer()
+        out.cell( out.title, 'Team Report for' )
+        out.write( ' ' )
+        out.cell( out.heading, first.strftime( '%F' ) )
+        out.write( ' ' )
+        out.cell( out.title, 'through' )
+        out.write( ' ' )
+        out.cell( out.heading, last.strftime( '%F' ) )
+        out.write( '\n' )
+
+        total = sum( users.values() )
+        if total == 0:
+            out.write( '    no entries\n' )
+            out.flush()
+            return
+
+        for user in sorted( users.keys() ):
+            if not users[user]: continue
+            out.write( '    ', out.duration( users[user] ), '  ' )
+            out.cell( out.label, user )
+            out.write( '\n' )
+        out.write( '\n    ', out.duration( total, underline = True ), '  ', out.total, '\n' )
+
+        if tickets:
+            out.write( '\n' )
+        for ticket in sorted( tickets.keys() ):
+            out.write( '    ', out.duration( sum( tickets[ticket].values() ) ), '  ' )
+            out.cell( out.ticket, ticket )
+            out.write( '\n' )
+            for user in sorted( tickets[ticket].keys() ):
+                out.write( '      ', out.duration( tickets[ticket][user] ), '  ', user, '\n' )
+
+        out.flush()
+
+
+def on_team_report( args ):
+    roots = [ os.path.abspath( os.path.expanduser( root ) ) for root in args.roots ]
+    missing = [ root for root in roots if not os.path.isdir( root ) ]
+    if missing:
+        sys.stderr.write( 'not a worklog directory: {}\n'.format( ', '.join( missing ) ) )
+        sys.exit( 2 )
+    first, last = parse_range_args( args )
+    team_report( roots, first, last, args.workers )
+
+
+def on_migrate( args ):
+    if not isinstance( open_storage(), FileStorage ):
+        sys.stderr.write( 'migrate converts day files, but the worklogs are stored in {}\n'.format( open_storage().name ) )
+        sys.exit( 2 )
+    codec = SNAPSHOT_FORMATS[args.format]
+    days = [ args.day ] if args.day else sorted( scan_days() )
+
+    migrated = 0
+    for day in days:
+        worklog = Worklog( when = day )
+        if len( worklog ) == 0 and worklog.persist_path is None: continue
+        if worklog.codec is codec and worklog.journal_length == 0: continue
+        # archived days keep the format they were packed in, unpacking them would undo archive
+        if worklog.archived and worklog.journal_length == 0: continue
+        worklog.compact( codec )
+        migrated += 1
+
+    sys.stdout.write( 'Migrated {:d} of {:d} days to the {} format\n'.format( migrated, len( days ), args.format ) )
+
+
+def archive_month( month, days ):
+    """Pack the YYYY-MM-DD days of the month starting on the date month into its archive
+
+    Every day of the month is locked while its files are read, packed and
+    removed, so no entry saved meanwhile is lost. The archive replaces any
+    earlier one of the month, and already holds every day before the first of
+    their files is removed."""
+    from contextlib import ExitStack
+
+    with traced( 'archive month' ), ExitStack() as locks:
+        for day in days:
+            locks.enter_context( DayLock( parse_date( day ) ) )
+
+        snapshots = list()
+        default_codec = SNAPSHOT_FORMATS[load_config().get( 'format', 'json' )]
+        for day in days:
+            worklog = Worklog( when = day )
+            codec = worklog.codec or default_codec
+            snapshots.append( ( worklog.when.day, codec, codec.dumps( worklog.store ) ) )
+        write_atomically( archive_path( month.strftime( '%Y-%m' ) ), DayArchive.pack( month.year, month.month, snapshots ) )
+
+        for day, snapshot in zip( days, snapshots ):
+            # a journal left behind by an interruption holds the note of the archived day, and isn't replayed over it
+            fold_journal( parse_date( day ), snapshot[2] )
+            for suffix in ( 'wlc', 'json', 'journal' ):
+                try:
+                    os.unlink( day_path( parse_date( day ), suffix ) )
+                except IOError as err:
+                    if err.errno != errno.ENOENT:
+                        raise
+
+
+def on_archive( args ):
+    if not isinstance( open_storage(), FileStorage ):
+        sys.stderr.write( 'archive packs day files, but the worklogs are stored in {}\n'.format( open_storage().name ) )
+        sys.exit( 2 )
+
+    # only closed months, today's month is still being written
+    current = date.today().strftime( '%Y-%m' )
+    months = dict()
+    loose = set()
+    for day, stamp in scan_days().items():
+        month = day[:7]
+        if month >= current: continue
+        if args.month is not None and month != args.month: continue
+        months.setdefault( month, list() ).append( day )
+        if any( part[0] != DayArchive.suffix for part in stamp ):
+            loose.add( month )
+
+    packed = 0
+    for month in sorted( loose ):
+        days = sorted( months[month] )
+        archive_month( parse_date( month + '-01' ), days )
+        packed += len( days )
+    sys.stdout.write( 'Archived {:d} days into {:d} months\n'.format( packed, len( loose ) ) )
+
+
+def on_sync( args ):
+    if args.source == args.target:
+        sys.stderr.write( 'sync needs two different storage backends\n' )
+        sys.exit( 2 )
+    source = STORAGE_BACKENDS[args.source]()
+    target = STORAGE_BACKENDS[args.target]()
+    days = [ args.day ] if args.day else sorted( source.scan() )
+
+    copied = 0
+    for day in days:
+        worklog = Worklog( when = day, storage = source )
+        copy = Worklog( when = day, storage = target )
+        if list( map( entry_key, copy ) ) == list( map( entry_key, worklog ) ): continue
+        copy[:] = list( worklog )
+        copy.save()
+        copied += 1
+
+    sys.stdout.write( 'Copied {:d} of {:d} days from {} to {}\n'.format( copied, len( days ), args.source, args.target ) )
+
+
+EXPORT_FIELDS = ( 'day', 'start', 'end', 'seconds', 'ticket', 'description' )
+EXPORT_ROW_GROUP = 4096
+
+def export_worklogs( first = None, last = None ):
+    """Every stored Worklog from first to last inclusive, in order, loaded one day at a time"""
+    first = first.strftime( '%F' ) if first else None
+    last = last.strftime( '%F' ) if last else None
+    for day in sorted( scan_days() ):
+        if first is not None and day < first: continue
+        if last is not None and day > last: break
+        yield Worklog( when = day )
+
+
+def export_rows( worklogs ):
+    """A tuple of EXPORT_FIELDS for every task of worklogs, a task still open ends now, or at the end of its day"""
+    for worklog in worklogs:
+        day = worklog.when.strftime( '%F' )
         for task, next_task in worklog.pairwise():
             if isinstance( task, GoHome ): continue
+            yield (
+                day,
+                task.start.isoformat( timespec = 'seconds' ),
+                next_task.start.isoformat( timespec = 'seconds' ),
+                int( ( next_task.start - task.start ).total_seconds() ),
+                task.ticket,
+                task.description,
+            )
 
-            if isinstance( next_task, DummyRightNow ):
-                colorize_end_time = Color.yellow
-            else:
-                colorize_end_time = Color.green
 
-            delta = next_task.start - task.start
-            if task.include_in_rollup():
-                total += delta
-                if task.description not in rollup:
-                    rollup[task.description] = delta
-                else:
-                    rollup[task.description] += delta
-
-            sys.stdout.write( '    {:5s} {} {:5s} {}{!s:>7}{}  {}  {}\n'.format(
-                Color.green( task.start.strftime( '%H:%M' ) ),
-                Color.black( '-', intense = True ),
-                colorize_end_time( next_task.start.strftime( '%H:%M' ) ),
-                Color.black( '(', intense = True ),
-                Duration( delta ).colorized(),
-                Color.black( ')', intense = True ),
-                task.ticket,
-                task.description
-            ) )
+def export_csv( rows, stream ):
+    import csv
 
-        sys.stdout.write( '\n    {!s:>7}  {}\n'.format(
-            Duration( total ).colorized( underline = True ),
-            Color.colorize( 'TOTAL', bold = True, underline = True )
-        ) )
-        for key in sorted( rollup.keys() ):
-            sys.stdout.write( '    {!s:>7}  {}\n'.format(
-                Duration( rollup[key] ).colorized(),
-                Color.bold( key )
-            ) )
+    writer = csv.writer( stream )
+    writer.writerow( EXPORT_FIELDS )
+    count = 0
+    for row in rows:
+        writer.writerow( row )
+        count += 1
+    return count
 
 
-def on_report( args ):
-    worklog = parse_common_args( args )
-    report( worklog )
+def export_jsonl( rows, stream ):
+    count = 0
+    for row in rows:
+        stream.write( json.dumps( dict( zip( EXPORT_FIELDS, row ) ), separators = ( ',', ':' ) ) + '\n' )
+        count += 1
+    return count
+
+
+def export_columns( rows, stream, group = EXPORT_ROW_GROUP ):
+    """Row groups of up to group rows, one JSON object per line with a list of values for each field
+
+    The first line describes the file. Within a group, the day, ticket and
+    description columns are dictionary encoded: the distinct values, then the
+    index of each row's value among them."""
+    from itertools import islice
+
+    stream.write( json.dumps( { 'format': 'worklog-columns', 'version': 1, 'fields': EXPORT_FIELDS }, separators = ( ',', ':' ) ) + '\n' )
+    rows = iter( rows )
+    count = 0
+    while True:
+        batch = list( islice( rows, group ) )
+        if not batch: break
+        columns = dict( zip( EXPORT_FIELDS, ( list( values ) for values in zip( *batch ) ) ) )
+        for field in ( 'day', 'ticket', 'description' ):
+            dictionary = dict()
+            ids = [ dictionary.setdefault( value, len( dictionary ) ) for value in columns[field] ]
+            columns[field] = { 'dictionary': list( dictionary ), 'ids': ids }
+        stream.write( json.dumps( { 'rows': len( batch ), 'columns': columns }, separators = ( ',', ':' ) ) + '\n' )
+        count += len( batch )
+    return count
+
+
+EXPORT_FORMATS = { 'csv': export_csv, 'jsonl': export_jsonl, 'columns': export_columns }
+
+def on_export( args ):
+    first = parse_date( args.range_from ) if args.range_from else None
+    last = parse_date( args.range_to ) if args.range_to else None
+    writer = EXPORT_FORMATS[args.format]
+    rows = export_rows( export_worklogs( first, last ) )
+
+    if args.output in ( None, '-' ):
+        writer( rows, sys.stdout )
+        return
+
+    started = perf_counter()
+    with open( args.output, 'w', newline = '' ) as stream:
+        count = writer( rows, stream )
+    elapsed = perf_counter() - started
+    sys.stderr.write( 'Exported {:d} entries to {} in {:.2f}s ({:.0f} entries/s)\n'.format(
+        count, args.output, elapsed, count / elapsed if elapsed else 0 ) )
+
+
+IMPORT_FORMATS = ( 'csv', 'jsonl' )
+
+class InvalidRecord( Exception ):
+    pass
+
+
+def parse_import_time( value ):
+    when = datetime.fromisoformat( value.strip() )
+    if when.tzinfo is not None:
+        when = when.astimezone().replace( tzinfo = None )
+    # whole minutes, like every other time worklog keeps
+    return when.replace( second = 0, microsecond = 0 )
+
+
+def read_import_records( stream, format ):
+    """( line, start, end, ticket, description ) for each record of a csv or jsonl stream
+
+    Records need a start and a description and may have a ticket, and either an
+    end or a duration in seconds; anything else, like the day of an export, is
+    ignored. A record without an end lasts until whatever comes next."""
+    if format == 'csv':
+        import csv
+        records = enumerate( csv.DictReader( stream ), 2 )
+    else:
+        records = ( ( line, text ) for line, text in enumerate( stream, 1 ) if text.strip() )
+
+    for line, record in records:
+        try:
+            if format != 'csv':
+                record = json.loads( record )
+                if not isinstance( record, dict ):
+                    raise TypeError( 'a record must be an object' )
+            # jsonl can hold anything, what ends up in a day file must be a string
+            for field in ( 'start', 'end', 'ticket', 'description' ):
+                if record.get( field ) not in ( None, '' ) and not isinstance( record[field], str ):
+                    raise TypeError( '{} must be a string'.format( field ) )
+            seconds = record.get( 'seconds' )
+            if seconds not in ( None, '' ) and ( isinstance( seconds, bool ) or not isinstance( seconds, ( int, str ) ) ):
+                raise TypeError( 'seconds must be a whole number' )
+            start = parse_import_time( record['start'] )
+            end = None
+            if record.get( 'end' ):
+                end = parse_import_time( record['end'] )
+            elif seconds not in ( None, '' ):
+                end = ( start + timedelta( seconds = int( seconds ) ) ).replace( second = 0 )
+            description = record['description'] or ''
+        except ( KeyError, TypeError, ValueError ) as err:
+            # json.JSONDecodeError is a ValueError
+            raise InvalidRecord( 'line {:d}: not a valid record, {!s}'.format( line, err ) )
+        if not description.strip():
+            raise InvalidRecord( 'line {:d}: a description is required'.format( line ) )
+        if end is not None and end <= start:
+            raise InvalidRecord( 'line {:d}: ends before it starts'.format( line ) )
+        yield line, start, end, record.get( 'ticket' ) or None, description
+
+
+def import_entries( records ):
+    """Task and GoHome entries for the records of one day, with the lines of both and the ends of the tasks
+
+    A record's end becomes a GoHome, unless the next record starts right then."""
+    entries = list()
+    ends = dict()
+    records = sorted( records, key = lambda record: record[1] )
+    for idx, ( line, start, end, ticket, description ) in enumerate( records ):
+        task = Task( start = start, ticket = ticket, description = description )
+        entries.append( task )
+        ends[id( task )] = ( line, end )
+        if end is None: continue
+        if idx + 1 < len( records ) and records[idx + 1][1] == end: continue
+        gohome = GoHome( start = end )
+        entries.append( gohome )
+        ends[id( gohome )] = ( line, None )
+    return entries, ends
+
+
+def merge_import( worklog, records ):
+    """The entries of worklog merged with records in one pass, the tasks added, and the problems found with them
+
+    Records already in the worklog are skipped, so importing a file twice
+    changes nothing. A record overlaps when another entry starts before its
+    end, when it starts at the same time as a different task, or when it
+    starts or ends while a task of the worklog runs; those run until the next
+    entry of the worklog, the last one on and on. A record's end is left out
+    where a task of the worklog starts anyway."""
+    import heapq
+    from bisect import bisect_left
+
+    existing = worklog.store
+    starts = [ entry.start for entry in existing ]
+    task_starts = set( entry.start for entry in existing if isinstance( entry, Task ) )
+
+    def running( when ):
+        """The task of the worklog running at when, None if there is none"""
+        idx = bisect_left( starts, when ) - 1
+        if idx < 0 or not isinstance( existing[idx], Task ):
+            return None
+        if idx + 1 < len( existing ) and existing[idx + 1].start <= when:
+            return None
+        return existing[idx]
+
+    entries, ends = import_entries( records )
+    imported_ids = set( id( entry ) for entry in entries )
+    merged = list()
+    added = 0
+    problems = dict()
+    for entry in heapq.merge( existing, entries, key = lambda entry: entry.start ):
+        imported = id( entry ) in imported_ids
+        idx = len( merged )
+        while idx > 0 and merged[idx - 1].start == entry.start and not same_entry( merged[idx - 1], entry ):
+            idx -= 1
+        if idx > 0 and same_entry( merged[idx - 1], entry ):
+            continue
+        if imported and isinstance( entry, GoHome ) and entry.start in task_starts:
+            continue
+        if imported and isinstance( entry, Task ) and merged and isinstance( merged[-1], Task ) and merged[-1].start == entry.start:
+            problems.setdefault( ends[id( entry )][0], 'starts at {} like {}'.format( entry.start.strftime( '%H:%M' ), merged[-1].description ) )
+        elif imported:
+            task = running( entry.start )
+            if task is not None:
+                problems.setdefault( ends[id( entry )][0], '{} at {}, while {} runs from {}'.format(
+                    'starts' if isinstance( entry, Task ) else 'ends', entry.start.strftime( '%H:%M' ),
+                    task.description, task.start.strftime( '%H:%M' ) ) )
+        merged.append( entry )
+        added += imported and isinstance( entry, Task )
+
+    for idx, entry in enumerate( merged ):
+        line, end = ends.get( id( entry ), ( None, None ) )
+        if end is None or idx + 1 == len( merged ): continue
+        following = merged[idx + 1]
+        if following.start < end:
+            problems.setdefault( line, '{} runs until {}, past the start of {} at {}'.format(
+                entry.description, end.strftime( '%H:%M' ),
+                getattr( following, 'description', 'a stop' ), following.start.strftime( '%H:%M' ) ) )
+    # one problem per record, the first found
+    return merged, added, [ 'line {:d}: {}'.format( line, problems[line] ) for line in sorted( problems ) ]
+
+
+def on_import( args ):
+    format = args.format
+    if format is None:
+        format = 'jsonl' if args.path.endswith( ( '.jsonl', '.json' ) ) else 'csv'
+
+    days = dict()
+    try:
+        if args.path == '-':
+            records = list( read_import_records( sys.stdin, format ) )
+        else:
+            with open( args.path, 'r', newline = '' ) as stream:
+                records = list( read_import_records( stream, format ) )
+    except InvalidRecord as err:
+        sys.stderr.write( '{}: {!s}\n'.format( args.path, err ) )
+        raise SystemExit( 1 )
+    for record in records:
+        days.setdefault( record[1].date(), list() ).append( record )
+
+    # every day is checked before any is written, so a bad file changes nothing
+    merges = list()
+    problems = list()
+    for day in sorted( days ):
+        worklog = Worklog( when = day )
+        merged, added, found = merge_import( worklog, days[day] )
+        problems.extend( '{} {}'.format( day.strftime( '%F' ), problem ) for problem in found )
+        if added:
+            merges.append( ( worklog, merged, added ) )
+
+    if problems:
+        for problem in problems:
+            sys.stderr.write( '{}\n'.format( problem ) )
+        sys.stderr.write( 'Nothing imported, {:d} records overlap other entries\n'.format( len( problems ) ) )
+        raise SystemExit( 1 )
+    if args.dry_run:
+        sys.stdout.write( 'Would import {:d} entries into {:d} days\n'.format( sum( merge[2] for merge in merges ), len( merges ) ) )
+        return
+
+    progress = sys.stderr.isatty()
+    started = perf_counter()
+    imported = 0
+    for done, ( worklog, merged, added ) in enumerate( merges, 1 ):
+        worklog.store = merged
+        worklog.rewrite = True
+        worklog.save()
+        imported += added
+        if progress:
+            elapsed = perf_counter() - started
+            sys.stderr.write( '\r{:d}/{:d} days, {:d} entries, {:.0f} entries/s'.format(
+                done, len( merges ), imported, imported / elapsed if elapsed else 0 ) )
+    if progress and merges:
+        sys.stderr.write( '\n' )
+
+    elapsed = perf_counter() - started
+    sys.stdout.write( 'Imported {:d} entries into {:d} days in {:.2f}s ({:.0f} entries/s)\n'.format(
+        imported, len( merges ), elapsed, imported / elapsed if elapsed else 0 ) )
 
 
 def on_upload( args ):
-    worklog = parse_common_args( args )
-    log_to_jira( worklog )
+    if args.flush:
+        if args.retry:
+            failures = drain_spool( workers = args.workers, rate = args.rate )
+        else:
+            failures = flush_spool( workers = args.workers, rate = args.rate )
+    else:
+        if args.range_from is not None:
+            first, last = parse_range_args( args )
+            # days already in the ledger count too, their entries may have all been removed since
+            days = set( scan_days() ).union( UploadLedger().days )
+            days = sorted( day for day in days if first.strftime( '%F' ) <= day <= last.strftime( '%F' ) )
+            worklogs = ( Worklog( when = day ) for day in days )
+        else:
+            worklogs = [ parse_common_args( args ) ]
+        failures = log_to_jira( worklogs, workers = args.workers, rate = args.rate )
+
+    for action, err in failures:
+        sys.stderr.write( 'Failed to {}: {}\n'.format( action, err ) )
+    if failures:
+        if not args.retry and any( JiraUploader.retryable( err ) for action, err in failures ):
+            sys.stderr.write( '{:d} entries left in the spool, retrying in the background\n'.format( len( UploadSpool().entries() ) ) )
+            start_upload_worker()
+        sys.exit( 1 )
+
+
+DAEMON_SOCKET = 'daemon.sock'
+DAEMON_COMMANDS = ( 'start', 'resume', 'stop', 'report', 'search' )
+DAEMON_CACHED_DAYS = 31
+
+# set only inside the daemon, see parse_common_args()
+worklog_cache = None
+
+class WorklogCache( object ):
+    """The worklogs and history index a daemon keeps in memory
+
+    A cached day is reused for as long as its files on disk are exactly as the
+    daemon last saw them, so changes made by commands run without the daemon
+    are still picked up."""
+
+    def __init__( self, size = DAEMON_CACHED_DAYS ):
+        from collections import OrderedDict
+
+        self.size = size
+        self.worklogs = OrderedDict()
+        self.touched = set()
+        self.index = HistoryIndex()
+        self.summaries = SummaryCache()
+
+    def get( self, when ):
+        when = parse_date( when ) if when else date.today()
+        day = when.strftime( '%F' )
+        stamp = day_stamp( when )
+        cached = self.worklogs.pop( day, None )
+        if cached is None or cached[1].pending:
+            cached = [ stamp, Worklog( when = when ) ]
+        elif cached[0] != stamp:
+            cached[1].refresh()
+            cached[0] = cached[1].stamp
+        self.worklogs[day] = cached
+        self.touched.add( day )
+        while len( self.worklogs ) > self.size:
+            self.worklogs.popitem( last = False )
+        return cached[1]
+
+    def settle( self ):
+        """Record the stamps left by the saves of the last request"""
+        for day in self.touched:
+            if day in self.worklogs:
+                self.worklogs[day][0] = day_stamp( parse_date( day ) )
+        self.touched.clear()
+
+    def forget( self ):
+        self.worklogs.clear()
+        self.touched.clear()
+
+
+def daemon_request( argv ):
+    """Run a command in the daemon, returns its exit status or None when it has to be run here instead"""
+    path = storage_path( DAEMON_SOCKET )
+    if not os.path.exists( path ):
+        return None
+
+    import socket
+
+    connection = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+    try:
+        connection.connect( path )
+    except OSError:
+        # a socket left behind by a daemon that was killed
+        connection.close()
+        return None
+
+    # once sent, the request must not be run a second time here, even if the daemon fails to answer
+    with connection:
+        request = { 'argv': argv, 'color': Color.ENABLED }
+        connection.sendall( json.dumps( request ).encode( 'utf-8' ) + b'\n' )
+        connection.shutdown( socket.SHUT_WR )
+        with connection.makefile( 'rb' ) as response_file:
+            data = response_file.read()
+    try:
+        response = json.loads( data.decode( 'utf-8' ) )
+    except ValueError:
+        sys.stderr.write( 'worklog daemon failed to answer\n' )
+        return 1
+
+    if response.get( 'fallback' ):
+        return None
+    sys.stdout.write( response['output'] )
+    sys.stderr.write( response['errors'] )
+    return response['status']
+
+
+def daemon_execute( parser, request ):
+    """Run a request from daemon_request() and build its response"""
+    import io
+    from contextlib import redirect_stderr, redirect_stdout
+    import traceback
+
+    argv = request['argv']
+    if not argv or argv[0] not in DAEMON_COMMANDS or '-h' in argv or '--help' in argv:
+        return { 'fallback': True }
+
+    output = io.StringIO()
+    errors = io.StringIO()
+    status = 0
+    Color.ENABLED = request.get( 'color', True )
+    with redirect_stdout( output ), redirect_stderr( errors ):
+        try:
+            args = parse_arguments( parser, argv )
+            # anything that has to prompt runs in the user's terminal
+            if args.command == 'start' and not ' '.join( args.description ).strip():
+                return { 'fallback': True }
+            if args.command == 'resume' and args.pick is None:
+                return { 'fallback': True }
+            if args.command == 'report' and args.watch:
+                return { 'fallback': True }
+            dispatch( parser, args )
+        except SystemExit as exit:
+            if isinstance( exit.code, int ):
+                status = exit.code
+            elif exit.code is not None:
+                errors.write( '{}\n'.format( exit.code ) )
+                status = 1
+        except Abort:
+            pass
+        except Exception:
+            traceback.print_exc()
+            status = 1
+            worklog_cache.forget()
+        finally:
+            worklog_cache.settle()
+
+    return { 'status': status, 'output': output.getvalue(), 'errors': errors.getvalue() }
+
+
+def on_daemon( args ):
+    global worklog_cache
+    import select
+    import signal
+    import socket
+
+    path = storage_path( DAEMON_SOCKET )
+    if os.path.exists( path ):
+        probe = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+        try:
+            probe.connect( path )
+        except OSError:
+            os.unlink( path )
+        else:
+            probe.close()
+            sys.stderr.write( 'a worklog daemon is already listening on {}\n'.format( path ) )
+            sys.exit( 1 )
+    if not os.access( WORKLOG_ROOT, os.F_OK ):
+        os.makedirs( WORKLOG_ROOT, mode=0o755 )
+
+    worklog_cache = WorklogCache()
+    parser = build_parser()
+
+    server = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+    old_umask = os.umask( 0o177 )
+    try:
+        server.bind( path )
+    finally:
+        os.umask( old_umask )
+    server.listen( 16 )
+
+    # SIGTERM lets the request being handled finish, the wakeup socket then ends the wait for the next one
+    stopping = False
+
+    def stop( *unused ):
+        nonlocal stopping
+        stopping = True
+
+    wakeup, wakeup_write = socket.socketpair()
+    wakeup_write.setblocking( False )
+    signal.set_wakeup_fd( wakeup_write.fileno() )
+    signal.signal( signal.SIGTERM, stop )
+    sys.stdout.write( 'worklog daemon listening on {}\n'.format( path ) )
+    sys.stdout.flush()
+
+    try:
+        while not stopping:
+            ready, unused, unused = select.select( [ server, wakeup ], [], [] )
+            if wakeup in ready:
+                wakeup.recv( 64 )
+            if stopping or server not in ready:
+                continue
+            connection, unused = server.accept()
+            with connection:
+                try:
+                    with connection.makefile( 'rb' ) as request_file:
+                        request = json.loads( request_file.readline().decode( 'utf-8' ) )
+                    response = daemon_execute( parser, request )
+                    connection.sendall( json.dumps( response ).encode( 'utf-8' ) )
+                except ( OSError, ValueError ):
+                    # a client that went away or sent garbage, it gets nothing back
+                    pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.set_wakeup_fd( -1 )
+        wakeup.close()
+        wakeup_write.close()
+        server.close()
+        os.unlink( path )
+
 
+def build_parser():
+    import argparse
+
+    class DedentHelpFormatter( argparse.RawDescriptionHelpFormatter ):
+        """Dedents descriptions and epilogs only when help is actually printed"""
+
+        def _fill_text( self, text, width, indent ):
+            import textwrap
+            return super( DedentHelpFormatter, self )._fill_text( textwrap.dedent( text ), width, indent )
 
-def main():
     parser = argparse.ArgumentParser(
         description = 'manage and report time allocation',
-        formatter_class = argparse.RawDescriptionHelpFormatter,
-        epilog = textwrap.dedent( """
+        formatter_class = DedentHelpFormatter,
+        epilog = """
             DURATIONs
               Spans of time can be provided in a concise format, a series of integers or
               floats each appended with a unit: d, h, m. Whitespace between each component
@@ -653,11 +3931,32 @@ def main():
               Example File:
                 { "username" : "jsmith" }
 
-              WARNING:
-                Uploading multiple times in one calendar day will cause inconsistencies with time tracking
-                on the server side.
-        """ ),
+              Setting "format" to "compact" stores new days in the compact binary format
+              instead of json, see the migrate command for converting existing days.
+
+              Setting "storage" to "sqlite" keeps the worklogs in ~/.worklog/worklog.sqlite3
+              instead of a few files per day, see the sync command for copying them over.
+
+            Upload Ledger:
+              ~/.worklog/uploads.json - Records what upload has already logged to Jira, so
+              uploading a day again only sends the entries that were added, changed or
+              removed since.
+
+            Jira Session:
+              ~/.worklog/jira-session.json - The session of the last upload, resumed by the
+              next one instead of logging in again until it expires.
+
+            Upload Spool:
+              ~/.worklog/spool - Entries on their way to Jira, left there by an upload that
+              could not reach it until upload --flush or the background worker sends them.
+              Setting "upload_on_stop" to true has stop spool the day and upload it in the
+              background, the worker logs to ~/.worklog/upload.log.
+        """,
     )
+    parser.add_argument( '--root', metavar = 'PATH', help = 'keep the worklogs in PATH instead of ~/.worklog or WORKLOG_HOME' )
+    parser.add_argument( '--profile', action = 'store_true', help = 'print where the time of the command went, see WORKLOG_TRACE' )
+    parser.add_argument( '--profile-json', metavar = 'PATH', help = 'like --profile, but write the timings and counts to PATH as json' )
+    parser.add_argument( '--profile-stats', metavar = 'PATH', help = 'like --profile, and also run the command under cProfile, saving its stats to PATH' )
     sub_parser = parser.add_subparsers( dest = 'command' )
 
     common_parser = argparse.ArgumentParser( add_help = False )
@@ -674,6 +3973,8 @@ def main():
     resume_parser = sub_parser.add_parser( 'resume', help = blurb, description = blurb, parents = [ common_parser ] )
     resume_parser.add_argument( '--ago', metavar = 'DURATION', help = 'start the task DURATION time ago, instead of now' )
     resume_parser.add_argument( '--at', metavar = 'TIME', help = 'start the task at TIME, instead of now' )
+    resume_parser.add_argument( '--days', metavar = 'N', type = int, default = RESUME_DAYS, help = 'offer the tasks of the last N days, {:d} at most'.format( RESUME_DAYS ) )
+    resume_parser.add_argument( '--pick', metavar = 'TEXT', help = 'resume the best ranked task matching TEXT without asking, for use in scripts' )
 
     blurb = 'close the currently open task'
     stop_parser = sub_parser.add_parser( 'stop', help = blurb, description = blurb, parents = [ common_parser ] )
@@ -681,23 +3982,153 @@ def main():
     stop_parser.add_argument( '--at', metavar = 'TIME', help = 'close the open task at TIME, instead of now' )
 
     blurb = 'report the current state of the worklog'
-    report_parser = sub_parser.add_parser( 'report', help = blurb, description = blurb, parents = [ common_parser ] )
+    report_parser = sub_parser.add_parser( 'report', help = blurb, parents = [ common_parser ],
+        description = '{}; a task still open runs until now today, and until midnight on an earlier day'.format( blurb ) )
+    report_parser.add_argument( '--from', dest = 'range_from', metavar = 'DATE', help = 'report on every day from DATE through --to, summarized per day' )
+    report_parser.add_argument( '--to', dest = 'range_to', metavar = 'DATE', help = 'last day of a --from range report, defaults to today' )
+    report_parser.add_argument( '--week', action = 'store_true', help = 'report on the week, monday through sunday, of DATE or of today, summarized per day' )
+    report_parser.add_argument( '--watch', '-w', action = 'store_true', help = 'keep the report on screen, updating it as the worklog changes, until interrupted' )
+
+    blurb = 'find tasks across all worklogs by words in their description or ticket'
+    search_parser = sub_parser.add_parser( 'search', help = blurb, description = blurb )
+    search_parser.add_argument( '--ticket', '-t', metavar = 'TICKET', action = 'append', help = 'only tasks on TICKET, can be repeated' )
+    search_parser.add_argument( '--from', dest = 'range_from', metavar = 'DATE', help = 'only tasks on or after DATE' )
+    search_parser.add_argument( '--to', dest = 'range_to', metavar = 'DATE', help = 'only tasks on or before DATE' )
+    search_parser.add_argument( '--rebuild', action = 'store_true', help = 'index every worklog again before searching' )
+    search_parser.add_argument( 'terms', metavar = 'TERM', nargs = '*', help = 'words every matching task mentions, end one with * to match by prefix' )
+
+    blurb = "report the time of many users over a range of days, totalled per user and per ticket, from a copy of each user's worklog directory"
+    team_parser = sub_parser.add_parser( 'team-report', help = blurb, description = blurb )
+    team_parser.add_argument( '--from', dest = 'range_from', metavar = 'DATE', required = True, help = 'report on every day from DATE through --to' )
+    team_parser.add_argument( '--to', dest = 'range_to', metavar = 'DATE', help = 'last day of the report, defaults to today' )
+    team_parser.add_argument( '--workers', metavar = 'COUNT', type = int, help = 'load up to COUNT users at once, each in a process of its own, defaults to one per cpu' )
+    team_parser.add_argument( 'roots', metavar = 'DIRECTORY', nargs = '+', help = "a user's worklog directory, named after the user or inside a directory that is" )
+
+    blurb = 'convert stored worklogs to another file format'
+    migrate_parser = sub_parser.add_parser( 'migrate', help = blurb, description = blurb )
+    migrate_parser.add_argument( '--day', '-d', help = 'convert only the worklog for DATE, defaults to every day' )
+    migrate_parser.add_argument( '--format', choices = sorted( SNAPSHOT_FORMATS ), default = 'compact', help = 'the format to convert to, defaults to compact' )
+
+    blurb = 'pack the day files of each closed month into a single archive file'
+    archive_parser = sub_parser.add_parser( 'archive', help = blurb, description = blurb )
+    archive_parser.add_argument( '--month', metavar = 'YYYY-MM', help = 'archive only MONTH, defaults to every month before this one' )
+
+    blurb = 'copy the worklogs from one storage backend to another, only the days that differ'
+    sync_parser = sub_parser.add_parser( 'sync', help = blurb, description = blurb )
+    sync_parser.add_argument( '--day', '-d', help = 'copy only the worklog for DATE, defaults to every day' )
+    sync_parser.add_argument( 'source', metavar = 'SOURCE', choices = sorted( STORAGE_BACKENDS ), help = 'the backend to copy from, files or sqlite' )
+    sync_parser.add_argument( 'target', metavar = 'TARGET', choices = sorted( STORAGE_BACKENDS ), help = 'the backend to copy to' )
+
+    blurb = 'write every task in the worklogs, with its duration, to a file other programs can load'
+    export_parser = sub_parser.add_parser( 'export', help = blurb, description = blurb )
+    export_parser.add_argument( '--format', choices = sorted( EXPORT_FORMATS ), default = 'csv', help = 'the format to write, defaults to csv' )
+    export_parser.add_argument( '--from', dest = 'range_from', metavar = 'DATE', help = 'only tasks on or after DATE' )
+    export_parser.add_argument( '--to', dest = 'range_to', metavar = 'DATE', help = 'only tasks on or before DATE' )
+    export_parser.add_argument( '--output', '-o', metavar = 'PATH', help = 'write to PATH instead of the standard output' )
+
+    blurb = 'add the tasks of a csv or jsonl file, like one from export or another tracker, to the worklogs'
+    import_parser = sub_parser.add_parser( 'import', help = blurb, description = blurb )
+    import_parser.add_argument( '--format', choices = IMPORT_FORMATS, help = 'the format of PATH, guessed from its extension by default' )
+    import_parser.add_argument( '--dry-run', '-n', action = 'store_true', help = 'only check the records against the worklogs, write nothing' )
+    import_parser.add_argument( 'path', metavar = 'PATH', help = 'the file to import, - for the standard input' )
 
     blurb = 'uploads worklog time to jira'
     upload_parser = sub_parser.add_parser( 'upload', help = blurb, description = blurb, parents = [ common_parser ] )
-
-    args = parser.parse_args()
+    upload_parser.add_argument( '--from', dest = 'range_from', metavar = 'DATE', help = 'upload every day from DATE through --to' )
+    upload_parser.add_argument( '--to', dest = 'range_to', metavar = 'DATE', help = 'last day of a --from range upload, defaults to today' )
+    upload_parser.add_argument( '--rate', metavar = 'CALLS', type = float, default = UPLOAD_RATE, help = 'make at most CALLS jira calls per second, 0 for no limit, defaults to {:d}'.format( UPLOAD_RATE ) )
+    upload_parser.add_argument( '--workers', metavar = 'COUNT', type = int, default = UPLOAD_WORKERS, help = 'post up to COUNT worklogs to jira at once, defaults to {:d}'.format( UPLOAD_WORKERS ) )
+    upload_parser.add_argument( '--flush', action = 'store_true', help = 'only send what is left in the spool, from earlier uploads and stops' )
+    upload_parser.add_argument( '--retry', action = 'store_true', help = 'with --flush, keep flushing, waiting longer each time, while jira is unreachable' )
+
+    blurb = 'keep worklogs in memory and serve start, stop and report from a faster, long running process'
+    sub_parser.add_parser( 'daemon', help = blurb, description = blurb )
+
+    return parser
+
+
+def parse_arguments( parser, argv = None ):
+    args = parser.parse_args( argv )
+    if args.command in ( 'report', 'upload' ):
+        if args.range_to is not None and args.range_from is None:
+            parser.error( '--to requires --from' )
+        if args.range_from is not None and args.day is not None:
+            parser.error( '--day and --from are mutually exclusive' )
+        if args.command == 'report' and args.watch and ( args.range_from is not None or args.week ):
+            parser.error( '--watch only works with the report of a single day' )
+        if args.command == 'report' and args.week and args.range_from is not None:
+            parser.error( '--week and --from are mutually exclusive' )
+        if args.command == 'upload' and args.flush and ( args.range_from is not None or args.day is not None ):
+            parser.error( '--flush sends the spool as it is, it takes no --day or --from' )
+        if args.command == 'upload' and args.retry and not args.flush:
+            parser.error( '--retry requires --flush' )
+    if args.command == 'resume' and not 1 <= args.days <= RESUME_DAYS:
+        parser.error( '--days must be from 1 to {:d}'.format( RESUME_DAYS ) )
+    return args
+
+
+def dispatch( parser, args ):
     try:
-        handler = globals()['on_{}'.format( args.command )]
+        handler = globals()['on_{}'.format( args.command.replace( '-', '_' ) )]
     except KeyError:
         parser.print_help()
     else:
-        if isinstance( handler, Callable ):
+        if callable( handler ):
             handler( args )
         else:
             parser.error( "unrecognized command: '{}'".format( args.command ) )
 
 
+def main( started = None ):
+    """Run the command line, started is when the launcher began importing this module"""
+    global trace, WORKLOG_ROOT
+
+    entered = perf_counter()
+    Color.ENABLED = color_enabled( sys.stdout )
+    tracing = os.environ.get( 'WORKLOG_TRACE' )
+    if len( sys.argv ) > 1 and sys.argv[1] in DAEMON_COMMANDS and not os.environ.get( 'WORKLOG_NO_DAEMON' ) and not tracing:
+        status = daemon_request( sys.argv[1:] )
+        if status is not None:
+            sys.exit( status )
+
+    parser = build_parser()
+    args = parse_arguments( parser )
+    if args.root is not None:
+        WORKLOG_ROOT = os.path.abspath( os.path.expanduser( args.root ) )
+    if not ( tracing or args.profile or args.profile_json or args.profile_stats ):
+        dispatch( parser, args )
+        return
+
+    trace = Trace( started if started is not None else entered )
+    if started is not None:
+        trace.add( 'import', entered - started )
+    trace.add( 'parse arguments', perf_counter() - entered )
+
+    profile = None
+    if args.profile_stats:
+        import cProfile
+        profile = cProfile.Profile()
+
+    try:
+        with traced( 'command {}'.format( args.command ) ):
+            if profile is None:
+                dispatch( parser, args )
+            else:
+                profile.runcall( dispatch, parser, args )
+    finally:
+        if profile is not None:
+            profile.dump_stats( args.profile_stats )
+        path = args.profile_json
+        if path is None and tracing and tracing.endswith( '.json' ):
+            path = tracing
+        if path is None:
+            trace.write( sys.stderr )
+        else:
+            with open( path, 'w' ) as json_file:
+                json.dump( trace.to_json(), json_file, indent = 2 )
+                json_file.write( '\n' )
+
+
 if __name__ == '__main__':
     try:
         main()
@@ -3,14 +3,41 @@ _worklog(){
 	local options
 
 	case "${COMP_WORDS[1]}" in
-		start|stop|resume)
+		start|stop)
 			options="--ago --at --day"
 			;;
+		resume)
+			options="--ago --at --day --days --pick"
+			;;
 		report)
-			options="--day"
+			options="--day --from --to --week --watch"
+			;;
+		search)
+			options="--ticket --from --to --rebuild"
+			;;
+		export)
+			options="--format --from --to --output"
+			;;
+		import)
+			options="--format --dry-run"
+			;;
+		team-report)
+			options="--from --to --workers"
+			;;
+		archive)
+			options="--month"
+			;;
+		sync)
+			options="--day files sqlite"
+			;;
+		migrate)
+			options="--day --format"
+			;;
+		upload)
+			options="--day --from --to --rate --workers --flush --retry"
 			;;
 		*)
-			options="start stop resume report"
+			options="--root --profile --profile-json --profile-stats start stop resume report team-report search export import upload migrate archive sync daemon"
 			;;
 	esac
 